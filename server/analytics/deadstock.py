@@ -1,4 +1,4 @@
-from config.gemini_config import gemini_model
+from config.llm_gateway import gemini_generate
 from config.dbConfig import db
 import json
 import re
@@ -46,8 +46,7 @@ def identify_deadstocks():
         }}
         """
 
-        response = gemini_model.generate_content(prompt)
-        ai_response = response.text.strip()
+        ai_response = gemini_generate(prompt).strip()
 
         clean_response = re.sub(r'``````', '', ai_response).strip()
 
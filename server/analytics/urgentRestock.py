@@ -1,5 +1,5 @@
 import json
-from config.gemini_config import gemini_model
+from config.llm_gateway import gemini_generate
 from config.dbConfig import db
 
 order_collection = db["orders"]
@@ -66,9 +66,7 @@ def get_urgent_restocking():
         - Do NOT add explanations, only return JSON output.
         """
 
-        response = gemini_model.generate_content(prompt)
-
-        response_text = response.text.strip()
+        response_text = gemini_generate(prompt).strip()
 
         try:
             json_start = response_text.find("{")
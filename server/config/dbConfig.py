@@ -1,26 +1,105 @@
 from pymongo import MongoClient
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from config.db_indexes import ensure_indexes
 
 load_dotenv()
 
 MONGO_URI = os.getenv('MONGO_URI')
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# Comma-separated; zstd and snappy need their optional packages, zlib is always available
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
 
 DATABASE_NAME = "store_db"
 collections = ["orders", "inventory", "customers", "chat_history", "feedback", "errors"]
 
+_client = None
+_client_lock = threading.Lock()
+
+def client_options():
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connect": False,
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+def get_client():
+    """The shared MongoClient, created on first use; every thread in the process draws from its pool."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URI, **client_options())
+                threading.Thread(target=bootstrap, daemon=True, name="MongoBootstrapThread").start()
+    return _client
+
 def connect_db():
-    """Establishes a connection to the MongoDB database and returns the database instance."""
-    mongo_client = MongoClient(MONGO_URI)
-    db = mongo_client[DATABASE_NAME]
-    
-    existing_collections = db.list_collection_names()
-    missing_collections = [col for col in collections if col not in existing_collections]
+    """Returns the database instance. Does not wait for the server; the first operation does."""
+    return get_client()[DATABASE_NAME]
+
+def get_collection(name):
+    return connect_db()[name]
+
+def bootstrap():
+    """Warns about missing collections and creates the declared indexes, off the import path."""
+    try:
+        database = connect_db()
+        existing_collections = database.list_collection_names()
+        missing_collections = [col for col in collections if col not in existing_collections]
+
+        if missing_collections:
+            print(f"Warning: The following collections are missing - {missing_collections}")
+
+        ensure_indexes(database)
+        print("Connected to database")
+    except Exception as e:
+        print(f"Database bootstrap failed, indexes will be created on the next start: {e}")
+
+def ping():
+    """Health probe: round-trips a ping to the server and reports the latency."""
+    started = time.perf_counter()
+    try:
+        get_client().admin.command("ping")
+        return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2), "max_pool_size": MONGO_MAX_POOL_SIZE}
+    except Exception as e:
+        return {"ok": False, "latency_ms": round((time.perf_counter() - started) * 1000, 2), "error": str(e)}
+
+class LazyCollection:
+    """Stands in for a Collection so modules can bind collections at import without connecting."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(get_collection(self.name), attribute)
+
+    def __repr__(self):
+        return f"LazyCollection({DATABASE_NAME}.{self.name})"
+
+class LazyDatabase:
+    """Import-time handle for the database: db["orders"] is lazy, any other attribute creates the client."""
+
+    def __getitem__(self, name):
+        return LazyCollection(name)
 
-    if missing_collections:
-        print(f"Warning: The following collections are missing - {missing_collections}")
+    def __getattr__(self, attribute):
+        return getattr(connect_db(), attribute)
 
-    print("Connected to database")
-    return db
+    def __repr__(self):
+        return f"LazyDatabase({DATABASE_NAME})"
 
-db = connect_db()
\ No newline at end of file
+db = LazyDatabase()
@@ -0,0 +1,142 @@
+"""
+Indexes required by the application's queries, declared in one place.
+
+ensure_indexes(db) creates any that are missing and is safe to call on every startup.
+Run `python -m config.db_indexes --audit` from the server directory to explain the hot queries
+in AUDIT_QUERIES against the live database and flag the ones that still scan a collection.
+"""
+import argparse
+import json
+from pymongo import ASCENDING, DESCENDING
+
+# collection -> [(keys, options)]
+INDEXES = {
+    "orders": [
+        ([("fingerprint", ASCENDING), ("placed_at", DESCENDING)], {"name": "fingerprint_placed_at"}),
+        ([("placed_at", DESCENDING)], {"name": "placed_at"}),
+        ([("email", ASCENDING), ("placed_at", DESCENDING)], {"name": "email_placed_at"}),
+        ([("status", ASCENDING), ("placed_at", DESCENDING)], {"name": "status_placed_at"}),
+        ([("orderLink", ASCENDING)], {"name": "orderLink"}),
+    ],
+    "inventory": [
+        ([("name", ASCENDING)], {"name": "name"}),
+    ],
+    "customers": [
+        ([("email_normalized", ASCENDING)], {
+            "name": "email_normalized_unique",
+            "unique": True,
+            "partialFilterExpression": {"email_normalized": {"$type": "string"}},
+        }),
+        # Legacy lookup for customers created before email_normalized existed
+        ([("email", ASCENDING)], {"name": "email"}),
+    ],
+    "customer_orders": [
+        ([("customer_id", ASCENDING), ("placed_at", DESCENDING)], {"name": "customer_placed_at"}),
+        ([("order_id", ASCENDING)], {"name": "order_id_unique", "unique": True}),
+    ],
+    "chat_history": [
+        ([("session_id", ASCENDING), ("timestamp", DESCENDING)], {"name": "session_timestamp"}),
+    ],
+    "feedback": [
+        ([("id", ASCENDING)], {"name": "id"}),
+        ([("timestamp", DESCENDING)], {"name": "timestamp"}),
+    ],
+    "errors": [
+        ([("timestamp", DESCENDING)], {"name": "timestamp"}),
+        ([("severity", ASCENDING), ("timestamp", DESCENDING)], {"name": "severity_timestamp"}),
+    ],
+}
+
+# Query shapes used by the code, with where they come from. expect_scan marks deliberate
+# full-collection reads (inventory listing, analytics, error log) that are reported but not flagged.
+AUDIT_QUERIES = [
+    {"source": "order_handling.add_orders_to_collection (duplicate check)", "collection": "orders",
+     "filter": {"fingerprint": "x", "placed_at": {"$gte": {"$date": 0}}}},
+    {"source": "order_handling.process_order_change", "collection": "orders",
+     "filter": {"email": "x"}, "sort": {"placed_at": -1}},
+    {"source": "main.get_orders / get_order_details", "collection": "orders", "filter": {}, "sort": {"placed_at": -1}},
+    {"source": "main analytics ($match)", "collection": "orders", "filter": {"placed_at": {"$gte": {"$date": 0}}}},
+    {"source": "payment.stripe_payment.create_payment_link", "collection": "orders", "filter": {"orderLink": "x"}},
+    {"source": "inventory_reservation.inventory_snapshot", "collection": "inventory", "filter": {"name": {"$in": ["x"]}}},
+    {"source": "inventory_reservation.reserve_stock", "collection": "inventory",
+     "filter": {"name": "x", "quantity": {"$gte": 1}}},
+    {"source": "inventory_reservation._reserve_with_compensation (tag cleanup)", "collection": "inventory",
+     "filter": {"name": {"$in": ["x"]}, "reservations.x": {"$exists": True}}},
+    {"source": "customer_store.get_customer", "collection": "customers", "filter": {"email_normalized": "x"}},
+    {"source": "customer_store.get_customer (legacy fallback)", "collection": "customers",
+     "filter": {"email": "x", "email_normalized": {"$exists": False}}},
+    {"source": "customer_store.get_customer_orders", "collection": "customer_orders",
+     "filter": {"customer_id": "x"}, "sort": {"placed_at": -1}},
+    {"source": "customer_store.update_customer_order_status", "collection": "customer_orders", "filter": {"order_id": "x"}},
+    {"source": "chat.get_chat_history / new_chatbot.get_chat_history", "collection": "chat_history",
+     "filter": {"session_id": "x"}, "sort": {"timestamp": -1}},
+    {"source": "feedback_handle.store_feedback", "collection": "feedback", "filter": {"id": {"$in": ["x"]}}},
+    {"source": "main.get_product_analytics (recent feedback)", "collection": "feedback", "filter": {}, "sort": {"timestamp": -1}},
+    {"source": "analytics.* (full order scan)", "collection": "orders", "filter": {}, "expect_scan": True},
+    {"source": "main.get_inventory / analytics (full inventory scan)", "collection": "inventory", "filter": {}, "expect_scan": True},
+    {"source": "main.get_errors", "collection": "errors", "filter": {}, "expect_scan": True},
+]
+
+def ensure_indexes(db, collections=None):
+    """Creates the declared indexes (for the given collections, or all); returns the names created or confirmed."""
+    ensured = []
+    for collection_name, indexes in INDEXES.items():
+        if collections is not None and collection_name not in collections:
+            continue
+        for keys, options in indexes:
+            try:
+                ensured.append(db[collection_name].create_index(keys, **options))
+            except Exception as e:
+                # e.g. duplicate customer emails: run migrations.normalize_customer_emails, then restart
+                print(f"Could not create index {options['name']} on {collection_name}: {e}")
+    return ensured
+
+def _from_extended_json(value):
+    if isinstance(value, dict):
+        if set(value) == {"$date"}:
+            from datetime import datetime, timezone
+            return datetime.fromtimestamp(value["$date"] / 1000, tz=timezone.utc)
+        return {key: _from_extended_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_from_extended_json(item) for item in value]
+    return value
+
+def plan_stages(plan):
+    """Stage names of an explain plan tree, root first."""
+    stages = [plan.get("stage")]
+    for child in plan.get("inputStages", []) + [plan.get("inputStage")]:
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+def audit(db):
+    """Explains every AUDIT_QUERIES entry; prints the winning plan and returns the unexpected scans."""
+    flagged = []
+    for query in AUDIT_QUERIES:
+        command = {"find": query["collection"], "filter": _from_extended_json(query["filter"])}
+        if query.get("sort"):
+            command["sort"] = query["sort"]
+        explained = db.command("explain", command, verbosity="queryPlanner")
+        winning = explained["queryPlanner"]["winningPlan"]
+        stages = [stage for stage in plan_stages(winning.get("queryPlan", winning)) if stage]
+
+        scans = "COLLSCAN" in stages
+        status = "scan (expected)" if scans and query.get("expect_scan") else "COLLSCAN" if scans else "indexed"
+        print(f"{status:16} {query['collection']:16} {' > '.join(stages):40} {query['source']}")
+        if scans and not query.get("expect_scan"):
+            flagged.append(query)
+
+    print(f"\n{len(flagged)} of {len(AUDIT_QUERIES)} queries do an unexpected collection scan")
+    return flagged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the declared MongoDB indexes and audit query plans")
+    parser.add_argument("--audit", action="store_true", help="explain the known hot queries and flag collection scans")
+    parser.add_argument("--no-create", action="store_true", help="do not create missing indexes first")
+    args = parser.parse_args()
+
+    from config.dbConfig import db
+    if not args.no_create:
+        print(f"Ensured indexes: {json.dumps(ensure_indexes(db))}")
+    if args.audit:
+        raise SystemExit(1 if audit(db) else 0)
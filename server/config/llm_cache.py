@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from config.local_store import get_connection, ensure_schema
+
+load_dotenv()
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+EVICT_EVERY_PUTS = 100
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS llm_responses (
+        cache_key TEXT PRIMARY KEY,
+        site TEXT NOT NULL,
+        model TEXT NOT NULL,
+        response TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses (last_access)",
+]
+
+def cache_key(model, prompt, options=None):
+    payload = json.dumps([model, prompt, options], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class PromptCache:
+    """
+    Disk-backed prompt -> response cache for deterministic LLM calls.
+
+    Entries expire after their TTL; when the cache grows past max_entries or max_bytes the
+    least recently used entries are evicted. Hit/miss counters are kept per call site.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                 max_entries=LLM_CACHE_MAX_ENTRIES, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.site_stats = {}
+        self._puts = 0
+        self._lock = threading.Lock()
+        ensure_schema(self._conn(), SCHEMA)
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _count(self, site, key):
+        with self._lock:
+            stats = self.site_stats.setdefault(site, {"hits": 0, "misses": 0})
+            stats[key] += 1
+
+    def get(self, site, key, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT response, created_at FROM llm_responses WHERE cache_key = ?", (key,)
+        ).fetchone()
+
+        if row is None or now - row["created_at"] > ttl:
+            self._count(site, "misses")
+            return None
+
+        conn.execute("UPDATE llm_responses SET last_access = ? WHERE cache_key = ?", (now, key))
+        self._count(site, "hits")
+        return row["response"]
+
+    def put(self, site, model, key, response):
+        if response is None:
+            return
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO llm_responses (cache_key, site, model, response, size, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, site, model, response, len(response.encode("utf-8")), now, now),
+        )
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % EVICT_EVERY_PUTS == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until both size limits hold."""
+        conn = self._conn()
+        conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+        row = conn.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM llm_responses").fetchone()
+        entries, total_bytes = row["entries"], row["bytes"]
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for item in conn.execute("SELECT cache_key, size FROM llm_responses ORDER BY last_access").fetchall():
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (item["cache_key"],))
+            entries -= 1
+            total_bytes -= item["size"]
+            removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            sites = {site: dict(values) for site, values in self.site_stats.items()}
+        for values in sites.values():
+            lookups = values["hits"] + values["misses"]
+            values["hit_rate"] = values["hits"] / lookups if lookups else 0.0
+        return sites
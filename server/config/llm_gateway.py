@@ -0,0 +1,227 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import requests
+from requests.adapters import HTTPAdapter
+from ai21 import AI21Client
+from ai21.models.chat import UserMessage
+from dotenv import load_dotenv
+from config.gemini_config import gemini_model
+from config.llm_cache import PromptCache, cache_key
+
+load_dotenv()
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+    "TooManyRequestsError", "ServerError", "APITimeoutError", "Timeout", "ReadTimeout",
+    "ConnectTimeout", "ConnectionError", "ConnectError", "RemoteProtocolError",
+}
+
+class LLMError(Exception):
+    pass
+
+class LLMTimeout(LLMError):
+    pass
+
+class TokenBucket:
+    """Classic token bucket: `rate_per_minute` sustained calls with bursts up to `burst`."""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                raise LLMTimeout("Rate limit wait would exceed the call deadline")
+            time.sleep(wait)
+
+class Provider:
+    """Per-provider concurrency limit, rate limit, worker threads and counters."""
+
+    def __init__(self, name, concurrency, rate_per_minute):
+        self.name = name
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.bucket = TokenBucket(rate_per_minute, burst=concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"llm-{name}")
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "timeouts": 0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+def _provider_from_env(name, default_concurrency, default_rate):
+    prefix = name.upper()
+    return Provider(
+        name,
+        int(os.getenv(f"{prefix}_CONCURRENCY", str(default_concurrency))),
+        float(os.getenv(f"{prefix}_RATE_PER_MINUTE", str(default_rate))),
+    )
+
+providers = {
+    "gemini": _provider_from_env("gemini", 8, 300),
+    "ai21": _provider_from_env("ai21", 4, 120),
+}
+
+prompt_cache = PromptCache()
+
+ai21_client = AI21Client(api_key=os.getenv("AI21KEY"), timeout_sec=LLM_TIMEOUT_SECONDS)
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_thread_calls = threading.local()
+
+def http_session():
+    """Shared requests.Session with a pooled adapter for plain HTTP APIs."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+    return _http_session
+
+def is_retryable(error):
+    if isinstance(error, LLMTimeout):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and status in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+def call_with_policy(provider_name, fn, timeout=None, retries=None):
+    """
+    Runs fn(remaining_seconds) under the provider's semaphore and rate limit, retrying
+    transient errors with jittered exponential backoff until the overall deadline.
+    """
+    provider = providers[provider_name]
+    timeout = timeout or LLM_TIMEOUT_SECONDS
+    retries = LLM_MAX_RETRIES if retries is None else retries
+    deadline = time.monotonic() + timeout
+    _thread_calls.count = getattr(_thread_calls, "count", 0) + 1
+
+    attempt = 0
+    while True:
+        attempt += 1
+        started = time.monotonic()
+        try:
+            remaining = deadline - started
+            if remaining <= 0 or not provider.semaphore.acquire(timeout=remaining):
+                raise LLMTimeout(f"{provider_name} call deadline exceeded while waiting for a slot")
+
+            try:
+                provider.bucket.acquire(deadline)
+                future = provider.executor.submit(fn, max(deadline - time.monotonic(), 0.1))
+            except BaseException:
+                provider.semaphore.release()
+                raise
+            # The slot is released when the call actually finishes, even if the caller gave up on it.
+            future.add_done_callback(lambda _: provider.semaphore.release())
+
+            try:
+                result = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeoutError:
+                provider.count("timeouts")
+                raise LLMTimeout(f"{provider_name} call exceeded its {timeout:g}s deadline")
+
+            provider.count("calls")
+            provider.count("seconds", time.monotonic() - started)
+            return result
+
+        except Exception as e:
+            backoff = random.uniform(0, LLM_RETRY_BASE_SECONDS * (2 ** (attempt - 1)))
+            if attempt > retries or not is_retryable(e) or time.monotonic() + backoff >= deadline:
+                provider.count("failures")
+                raise
+            provider.count("retries")
+            print(f"Retrying {provider_name} call after error ({attempt}/{retries}): {e}")
+            time.sleep(backoff)
+
+def cached_call(site, model, prompt, options, ttl_seconds, call):
+    """Serves call() from the prompt cache when the call site opted in with a site name."""
+    if not site:
+        return call()
+    key = cache_key(model, prompt, options)
+    cached = prompt_cache.get(site, key, ttl_seconds)
+    if cached is not None:
+        return cached
+    response = call()
+    prompt_cache.put(site, model, key, response)
+    return response
+
+def gemini_generate(prompt, timeout=None, generation_config=None, cache=None, cache_ttl=None):
+    """
+    Sends a prompt to the shared Gemini model and returns the response text.
+    Pass cache="<call site>" to serve repeated identical prompts from the prompt cache.
+    """
+    def call(remaining):
+        response = gemini_model.generate_content(
+            prompt,
+            generation_config=generation_config,
+            request_options={"timeout": remaining},
+        )
+        return response.text
+
+    model = getattr(gemini_model, "model_name", "gemini")
+    return cached_call(
+        cache, model, prompt, generation_config, cache_ttl,
+        lambda: call_with_policy("gemini", call, timeout=timeout),
+    )
+
+def ai21_chat(content, model="jamba-1.5-large", timeout=None, cache=None, cache_ttl=None, **kwargs):
+    """Sends a single user message to AI21 and returns the first choice's content (None if no choices)."""
+    def call(remaining):
+        response = ai21_client.chat.completions.create(
+            model=model,
+            messages=[UserMessage(content=content)],
+            **kwargs,
+        )
+        result = response.model_dump()
+        if "choices" in result and result["choices"]:
+            return result["choices"][0]["message"]["content"]
+        return None
+
+    return cached_call(
+        cache, model, content, kwargs, cache_ttl,
+        lambda: call_with_policy("ai21", call, timeout=timeout),
+    )
+
+def llm_call_count():
+    """Number of LLM calls made from the current thread (see reset_llm_call_count)."""
+    return getattr(_thread_calls, "count", 0)
+
+def reset_llm_call_count():
+    _thread_calls.count = 0
+
+def add_llm_call_count(calls):
+    """Credits calls made on another thread on behalf of the current one."""
+    _thread_calls.count = getattr(_thread_calls, "count", 0) + calls
+
+def gateway_stats():
+    stats = {}
+    for name, provider in providers.items():
+        with provider._stats_lock:
+            stats[name] = dict(provider.stats)
+    stats["cache"] = prompt_cache.stats()
+    return stats
@@ -0,0 +1,37 @@
+import os
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONITOR_DB_PATH = os.getenv("MONITOR_DB_PATH", "monitor_state.db")
+
+_local = threading.local()
+
+def get_connection(path=None):
+    """Returns a per-thread SQLite connection for local pipeline state (WAL, autocommit)."""
+    path = path or MONITOR_DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        connections[path] = conn
+    return conn
+
+def ensure_schema(conn, statements):
+    for statement in statements:
+        conn.execute(statement)
+
+def ensure_column(conn, table, column, definition):
+    """Adds a column to a table created by an older schema version."""
+    columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
@@ -0,0 +1,235 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from dotenv import load_dotenv
+from pymongo import ReturnDocument, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from config.dbConfig import db
+
+load_dotenv()
+
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "2048"))
+CUSTOMER_FIELDS = ("name", "email", "phone", "address")
+# Customers not yet migrated by migrations.split_customer_orders may still embed past_orders
+CUSTOMER_PROJECTION = {"past_orders": 0}
+# Orders in these statuses are not (or no longer) committed and do not count towards lifetime_spend
+UNCOMMITTED_STATUSES = ("pending inventory", "cancelled")
+
+customers_collection = db["customers"]
+customer_orders_collection = db["customer_orders"]
+
+def normalize_email(email):
+    match = re.search(r'<([^<>]+)>', email or "")
+    return (match.group(1) if match else email or "").strip().lower()
+
+class CustomerCache:
+    """Bounded LRU of customer documents keyed by normalized email; written through on every update."""
+
+    def __init__(self, max_entries=CUSTOMER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            customer = self.entries.get(key)
+            if customer is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(customer)
+
+    def put(self, key, customer):
+        with self._lock:
+            self.entries[key] = dict(customer)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+customer_cache = CustomerCache()
+
+def get_customer(email):
+    """The customer for a sender address, or None. Served from the cache when possible."""
+    key = normalize_email(email)
+    if not key:
+        return None
+
+    customer = customer_cache.get(key)
+    if customer is not None:
+        return customer
+
+    customer = customers_collection.find_one({"email_normalized": key}, CUSTOMER_PROJECTION)
+    if customer is None:
+        # Customers created before email_normalized existed; tag them so the next lookup is indexed
+        customer = customers_collection.find_one_and_update(
+            {"email": email, "email_normalized": {"$exists": False}},
+            {"$set": {"email_normalized": key}},
+            projection=CUSTOMER_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+    if customer is not None:
+        customer_cache.put(key, customer)
+    return customer
+
+def spend(total, status):
+    """What an order with this total and status contributes to lifetime_spend."""
+    return 0 if (status or "").lower() in UNCOMMITTED_STATUSES else total or 0
+
+def order_aggregates(order_summary):
+    """Update operators that roll one order into the customer's order_count, lifetime_spend and last_order."""
+    return {
+        "$inc": {"order_count": 1, "lifetime_spend": spend(order_summary.get("total"), order_summary.get("status"))},
+        "$set": {"last_order": {
+            field: order_summary.get(field) for field in ("order_id", "placed_at", "total", "status")
+        }},
+    }
+
+def get_or_create_customer(email, customer_details, order_summary=None):
+    """
+    Upserts the customer for a sender address in one round trip: details are only written when
+    the customer is created, and order_summary (if given) is rolled into the customer's aggregates
+    and stored in customer_orders. The unique email_normalized index makes concurrent calls for one
+    sender converge on a single document. Returns the customer.
+    """
+    key = normalize_email(email)
+    customer_details = customer_details or {}
+    insert_fields = {field: customer_details.get(field, "") for field in CUSTOMER_FIELDS}
+    insert_fields["email"] = insert_fields["email"] or email
+    insert_fields["created_at"] = datetime.utcnow()
+
+    query = {"email_normalized": key}
+    update = {"$setOnInsert": insert_fields}
+    if order_summary is not None:
+        update.update(order_aggregates(order_summary))
+        # A retried commit must not count the order twice: once it is the customer's last_order
+        # the aggregates already include it (rows from one sender are processed in order)
+        query["last_order.order_id"] = {"$ne": order_summary.get("order_id")}
+    else:
+        insert_fields.update({"order_count": 0, "lifetime_spend": 0})
+
+    for attempt in range(2):
+        try:
+            customer = customers_collection.find_one_and_update(
+                query,
+                update,
+                projection=CUSTOMER_PROJECTION,
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            break
+        except DuplicateKeyError:
+            # Either another worker created the customer between our match and insert (the retry
+            # matches it), or the order is already counted and the guard above excluded the customer
+            customer = customers_collection.find_one({"email_normalized": key}, CUSTOMER_PROJECTION)
+            if customer is not None and order_summary is not None and \
+                    (customer.get("last_order") or {}).get("order_id") == order_summary.get("order_id"):
+                break
+            if attempt:
+                raise
+
+    customer_cache.put(key, customer)
+    if order_summary is not None:
+        record_customer_order(customer["_id"], order_summary)
+    return customer
+
+def record_customer_order(customer_id, order_summary):
+    try:
+        customer_orders_collection.insert_one({"customer_id": customer_id, **order_summary})
+    except DuplicateKeyError:
+        print(f"Order {order_summary.get('order_id')} is already in the customer's history")
+
+def has_customer_order(order_id):
+    return customer_orders_collection.find_one({"order_id": str(order_id)}, {"_id": 1}) is not None
+
+def get_customer_orders(email, limit=20):
+    """Most recent order summaries for a sender, newest first."""
+    customer = get_customer(email)
+    if customer is None:
+        return []
+    return list(
+        customer_orders_collection.find({"customer_id": customer["_id"]}, {"_id": 0})
+        .sort("placed_at", DESCENDING)
+        .limit(limit)
+    )
+
+def _update_customer_by_id(customer_id, update, last_order_id=None):
+    """Applies update to a customer (only if its last_order is last_order_id, when given) and refreshes the cache."""
+    query = {"_id": customer_id}
+    if last_order_id is not None:
+        query["last_order.order_id"] = last_order_id
+    customer = customers_collection.find_one_and_update(
+        query, update, projection=CUSTOMER_PROJECTION, return_document=ReturnDocument.AFTER
+    )
+    if customer is not None and customer.get("email_normalized"):
+        customer_cache.put(customer["email_normalized"], customer)
+    return customer
+
+def update_customer_order_status(order_id, status):
+    """
+    Syncs a status change into the order summary and, if it is the latest order, the customer's
+    last_order. Orders moving into or out of UNCOMMITTED_STATUSES adjust lifetime_spend.
+    """
+    order_id = str(order_id)
+    previous = customer_orders_collection.find_one_and_update(
+        {"order_id": order_id}, {"$set": {"status": status}}, projection={"customer_id": 1, "total": 1, "status": 1}
+    )
+    if previous is None:
+        return
+    spend_delta = spend(previous.get("total"), status) - spend(previous.get("total"), previous.get("status"))
+    if spend_delta:
+        _update_customer_by_id(previous["customer_id"], {"$inc": {"lifetime_spend": spend_delta}})
+    _update_customer_by_id(previous["customer_id"], {"$set": {"last_order.status": status}}, last_order_id=order_id)
+
+def update_customer_order(order_id, products, total):
+    """
+    Rewrites an order summary after the order was changed and moves the change in its
+    total into the customer's lifetime_spend (and last_order, if it is the latest order).
+    """
+    order_id = str(order_id)
+    previous = customer_orders_collection.find_one_and_update(
+        {"order_id": order_id}, {"$set": {"products": products, "total": total}},
+        projection={"customer_id": 1, "total": 1, "status": 1},
+    )
+    if previous is None:
+        return
+    spend_delta = spend(total, previous.get("status")) - spend(previous.get("total"), previous.get("status"))
+    customer = _update_customer_by_id(previous["customer_id"], {"$inc": {"lifetime_spend": spend_delta}})
+    if customer is not None and (customer.get("last_order") or {}).get("order_id") == order_id:
+        _update_customer_by_id(customer["_id"], {"$set": {"last_order.total": total}}, last_order_id=order_id)
+
+def update_customer(email, fields):
+    """Updates customer fields and writes the result through to the cache."""
+    key = normalize_email(email)
+    customer = customers_collection.find_one_and_update(
+        {"email_normalized": key},
+        {"$set": fields},
+        projection=CUSTOMER_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if customer is None:
+        customer_cache.invalidate(key)
+    else:
+        customer_cache.put(key, customer)
+    return customer
+
+def get_customer_cache_stats():
+    return customer_cache.stats()
@@ -1,24 +1,16 @@
-from ai21 import AI21Client
-from ai21.models.chat import UserMessage
 import json
-import os
 from dotenv import load_dotenv
 from datetime import datetime
 from config.dbConfig import db
 from werkzeug.exceptions import HTTPException
 from flask import jsonify
+from config.llm_gateway import ai21_chat
 
 load_dotenv()
 error_collection = db["errors"]
 
-API_KEY = os.getenv("AI21KEY")
-
-client = AI21Client(api_key=API_KEY)
-
 def extract_email_details(email_text):
-    messages = [
-        UserMessage(
-            content=f"""
+    prompt = f"""
             You are an AI assistant extracting order and customer details from an email.
             Extract and return only in JSON format.
 
@@ -41,20 +33,11 @@ def extract_email_details(email_text):
             If customer details are not provided, set "customer" as null.
             If order details are not provided, set "orders" as null.
             """
-        )
-    ]
     
     try:
-        response = client.chat.completions.create(
-            model="jamba-1.5-large",
-            messages=messages,
-            top_p=1.0 
-        )
-
-        result = response.model_dump()
+        content_str = ai21_chat(prompt, top_p=1.0)
 
-        if "choices" in result and result["choices"]:
-            content_str = result["choices"][0]["message"]["content"]
+        if content_str:
             extracted_data = json.loads(content_str)
             
             return {
@@ -1,22 +1,140 @@
+import csv
+import os
+import re
+import time
 import requests
 from dotenv import load_dotenv
-import os
+from config.llm_gateway import http_session
 
 load_dotenv()
 
 AUTH_TOKEN = os.getenv("EMAIL_CLASSIFICATION_AUTH")
 LEVITY_API_URL = os.getenv("LEVITY_API_URL")
+LEVITY_TIMEOUT_SECONDS = float(os.getenv("LEVITY_TIMEOUT_SECONDS", "10"))
+LOCAL_CLASSIFIER_MIN_SCORE = float(os.getenv("LOCAL_CLASSIFIER_MIN_SCORE", "2"))
+LOCAL_CLASSIFIER_MIN_MARGIN = float(os.getenv("LOCAL_CLASSIFIER_MIN_MARGIN", "1"))
+SAMPLES_PATH = os.path.join(os.path.dirname(__file__), "classification_samples.csv")
+
+ORDER_ATTACHMENT_EXTENSIONS = (".pdf", ".xlsx", ".xls", ".csv")
+UNCERTAIN = "Uncertain"
+
+# (label, weight, pattern) - scores add up per label; the best label wins only with enough score and margin.
+RULES = [
+    ("Change to order", 3, r"\b(change|modify|update|amend|edit|revise|adjust)\b.{0,30}\b(my|the|our|previous|last|existing)\s+order\b"),
+    ("Change to order", 2, r"\b(increase|decrease|reduce|raise|lower)\b.{0,30}\bquantity\b"),
+    ("Change to order", 2, r"\b(add|remove|cancel|replace|swap)\b.{0,40}\b(to|from|in)\s+(my|the|our)\s+(previous\s+|last\s+|existing\s+)?order\b"),
+    ("Change to order", 1, r"\binstead of\b"),
+    ("Change to order", 1, r"\b(already placed|earlier order|order (number|no\.?|#|id))\b"),
+    ("Complaint", 3, r"\b(complain(t|ing)?|refund|unacceptable|disappointed|disappointing|terrible|worst|awful)\b"),
+    ("Complaint", 2, r"\b(damaged|broken|defective|faulty|cracked|leaking|torn|expired)\b"),
+    ("Complaint", 2, r"\b(never (arrived|received|delivered)|not (yet )?(arrived|received|delivered)|wrong (item|product|size|colou?r))\b"),
+    ("Complaint", 1, r"\b(late|delayed|missing|poor quality|unhappy|frustrated|rude)\b"),
+    ("Order confirmation", 3, r"\b(place|placing|confirm|confirming)\s+(an?\s+|my\s+|the\s+|this\s+)?(new\s+)?order\b"),
+    ("Order confirmation", 3, r"\bpurchase order\b"),
+    ("Order confirmation", 2, r"\b(i|we)('d| would| want to| wish to)?\s+(like to\s+)?(order|buy|purchase)\b"),
+    ("Order confirmation", 1, r"\b\d+\s*(x|units?|pcs|pieces|boxes|packs?|cartons?|dozens?)\b"),
+    ("Order confirmation", 1, r"\b(ship|deliver|send) (it |them |these |the order )?to\b"),
+]
+COMPILED_RULES = [(label, weight, re.compile(pattern, re.IGNORECASE)) for label, weight, pattern in RULES]
+
+def is_order_attachment(attachment_path):
+    if not attachment_path:
+        return False
+    name = os.path.basename(attachment_path).lower()
+    return name.endswith(ORDER_ATTACHMENT_EXTENSIONS) and bool(re.search(r"order|po[\W_\d]|purchase|invoice", name))
 
-def classify_email(body):
+def score_email(body, attachment_path=None):
+    scores = {"Order confirmation": 0, "Change to order": 0, "Complaint": 0}
+    for label, weight, pattern in COMPILED_RULES:
+        if pattern.search(body or ""):
+            scores[label] += weight
+    if is_order_attachment(attachment_path):
+        scores["Order confirmation"] += 3
+    return scores
+
+def classify_email_locally(body, attachment_path=None):
+    """Returns the rule-based label, or None when the rules are not confident enough."""
+    scores = score_email(body, attachment_path)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (label, best), (_, runner_up) = ranked[0], ranked[1]
+    if best >= LOCAL_CLASSIFIER_MIN_SCORE and best - runner_up >= LOCAL_CLASSIFIER_MIN_MARGIN:
+        return label
+    return None
+
+def classify_email_levity(body):
     headers = {
         "Authorization": AUTH_TOKEN,
         "Content-Type": "application/json"
     }
-    
+
     payload = {
         "textToClassify": body
     }
-    
-    response = requests.post(LEVITY_API_URL, json=payload, headers=headers)
-    result = response.json()
-    return result['labels'][0]['value'], response.status_code
\ No newline at end of file
+
+    try:
+        response = http_session().post(LEVITY_API_URL, json=payload, headers=headers, timeout=LEVITY_TIMEOUT_SECONDS)
+        result = response.json()
+        return result['labels'][0]['value'], response.status_code
+    except requests.Timeout:
+        print(f"Levity classification timed out after {LEVITY_TIMEOUT_SECONDS:g}s")
+        return None, 504
+    except Exception as e:
+        print(f"Error classifying email with Levity: {e}")
+        return None, 502
+
+def classify_email(body, attachment_path=None):
+    """Rule-based fast path for obvious emails; uncertain ones are sent to Levity."""
+    label = classify_email_locally(body, attachment_path)
+    if label:
+        return label, 200
+    return classify_email_levity(body)
+
+def load_samples(path=SAMPLES_PATH):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row["body"], row.get("attachment") or None, row["label"]) for row in csv.DictReader(f)]
+
+def evaluate(path=SAMPLES_PATH, use_levity=False):
+    """
+    Prints a confusion matrix and latency figures for the classifier on a labelled sample set.
+    Rows are true labels, columns the predicted label; "Uncertain" means the email would go to
+    Levity. With use_levity=True uncertain emails are classified by Levity as in production.
+    """
+    samples = load_samples(path)
+    labels = sorted({label for _, _, label in samples} | set(score_email("")))
+    columns = labels + [UNCERTAIN]
+    matrix = {label: {column: 0 for column in columns} for label in labels}
+
+    local_seconds, levity_seconds, levity_calls = 0.0, 0.0, 0
+    local_decided, local_correct = 0, 0
+    for body, attachment, label in samples:
+        started = time.perf_counter()
+        predicted = classify_email_locally(body, attachment)
+        local_seconds += time.perf_counter() - started
+        if predicted is not None:
+            local_decided += 1
+            local_correct += predicted == label
+
+        if predicted is None and use_levity:
+            started = time.perf_counter()
+            predicted = classify_email_levity(body)[0]
+            levity_seconds += time.perf_counter() - started
+            levity_calls += 1
+
+        column = predicted if predicted in columns else UNCERTAIN
+        matrix[label][column] += 1
+
+    width = max(len(column) for column in columns) + 2
+    print("".ljust(width) + "".join(column.ljust(width) for column in columns))
+    for label in labels:
+        print(label.ljust(width) + "".join(str(matrix[label][column]).ljust(width) for column in columns))
+
+    print(f"\nSamples: {len(samples)}, decided locally: {local_decided} ({local_decided / len(samples):.1%})")
+    if local_decided:
+        print(f"Local precision: {local_correct / local_decided:.1%}")
+    print(f"Local classifier: {local_seconds / len(samples) * 1e6:.1f} µs per email")
+    if levity_calls:
+        print(f"Levity: {levity_seconds / levity_calls * 1000:.1f} ms per call over {levity_calls} calls")
+    return matrix
+
+if __name__ == "__main__":
+    evaluate(use_levity=os.getenv("EVALUATE_WITH_LEVITY", "false").lower() in ("1", "true", "yes"))
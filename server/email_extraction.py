@@ -0,0 +1,126 @@
+import json
+import os
+import re
+import threading
+from dotenv import load_dotenv
+from config.llm_gateway import gemini_generate
+
+load_dotenv()
+
+EMAIL_PIPELINE = os.getenv("EMAIL_PIPELINE", "unified").lower()
+EMAIL_TYPES = ("Order confirmation", "Change to order", "Complaint", "Other")
+REVIEW_LABELS = ("good", "bad", "neutral")
+
+extraction_stats = {"emails": 0, "failures": 0, "llm_calls_avoided": 0}
+extraction_stats_lock = threading.Lock()
+
+def build_prompt(body, email, attachment_text=None):
+    attachment_section = f"""
+### **ATTACHMENT CONTENT**:
+{attachment_text}
+""" if attachment_text else ""
+
+    return f"""
+You are an AI assistant for an order desk. Read the email (and attachment, if any) and return a single JSON object.
+
+### **TASKS**:
+1. Classify the email as exactly one of: "Order confirmation", "Change to order", "Complaint", "Other".
+2. Extract customer details and ordered products from both the email body and the attachment.
+3. If a product name is mentioned without a quantity, assume quantity is 1.
+4. If the email is a complaint or contains a review, copy the review text and classify its sentiment as
+   "good", "bad" or "neutral"; otherwise set both to null.
+
+### **STRICT RESPONSE FORMAT (MUST FOLLOW THIS JSON SCHEMA)**:
+{{
+    "email_type": "Order confirmation | Change to order | Complaint | Other",
+    "customer": {{
+        "name": "string or empty if not found",
+        "email": "{email}",
+        "phone": "string or empty if not found",
+        "address": "string or empty if not found"
+    }},
+    "orders": [
+        {{"product": "string", "quantity": integer}}
+    ],
+    "review": "string or null",
+    "review_type": "good | bad | neutral | null"
+}}
+
+### **EMAIL BODY**:
+{body}
+{attachment_section}
+### **RETURN ONLY THE JSON DATA WITHOUT ANY MARKDOWN OR CODE BLOCK MARKERS**
+"""
+
+def parse_extraction(response_text, email):
+    """Validates the model's JSON against the schema; returns None when it is unusable."""
+    data = json.loads(re.sub(r"```json\s*|\s*```", "", response_text or "").strip())
+    if not isinstance(data, dict) or data.get("email_type") not in EMAIL_TYPES:
+        return None
+
+    customer = data.get("customer") if isinstance(data.get("customer"), dict) else {}
+    customer = {field: customer.get(field) or "" for field in ("name", "email", "phone", "address")}
+    customer["email"] = customer["email"] or email
+
+    orders = data.get("orders") if isinstance(data.get("orders"), list) else []
+    orders = [item for item in orders if isinstance(item, dict) and item.get("product")]
+
+    review = data.get("review") if isinstance(data.get("review"), str) and data.get("review").strip() else None
+    review_type = str(data.get("review_type") or "").strip().lower()
+
+    return {
+        "email_type": data["email_type"],
+        "customer": customer,
+        "orders": orders,
+        "review": review,
+        "review_type": review_type if review and review_type in REVIEW_LABELS else None,
+    }
+
+def legacy_call_count(extraction, has_attachment):
+    """
+    Model calls the legacy pipeline would have made for this email: Levity classification,
+    AI21 extraction, one or two send_to_gemini calls for attachments, and extract_review +
+    classify_review for complaints.
+    """
+    if has_attachment:
+        if extraction["orders"]:
+            return 1
+        calls = 2
+    else:
+        calls = 0
+
+    calls += 1
+    if extraction["email_type"] in ("Order confirmation", "Change to order"):
+        calls += 1
+    elif extraction["email_type"] == "Complaint":
+        calls += 2
+    return calls
+
+def extract_email(body, email, attachment_text=None):
+    """
+    Classifies the email and extracts customer, orders and review in one Gemini call.
+    Returns the validated extraction with "llm_calls_avoided" set, or None so callers can
+    fall back to the legacy classify/extract path.
+    """
+    try:
+        response_text = gemini_generate(
+            build_prompt(body, email, attachment_text),
+            generation_config={"response_mime_type": "application/json"},
+        )
+        extraction = parse_extraction(response_text, email)
+    except Exception as e:
+        print(f"Error in unified email extraction: {e}")
+        extraction = None
+
+    with extraction_stats_lock:
+        extraction_stats["emails"] += 1
+        if extraction is None:
+            extraction_stats["failures"] += 1
+            return None
+        extraction["llm_calls_avoided"] = legacy_call_count(extraction, bool(attachment_text)) - 1
+        extraction_stats["llm_calls_avoided"] += extraction["llm_calls_avoided"]
+    return extraction
+
+def get_extraction_stats():
+    with extraction_stats_lock:
+        return dict(extraction_stats)
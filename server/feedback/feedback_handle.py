@@ -1,10 +1,11 @@
-import requests
 from dotenv import load_dotenv
 import os
 from config.dbConfig import db
-from config.gemini_config import gemini_model
+from config.llm_gateway import gemini_generate, http_session
 import re
 import uuid
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 feedback_collection = db["feedback"]
@@ -12,6 +13,11 @@ feedback_collection = db["feedback"]
 SURVEY_ID = os.getenv("FORMBRICKS_SURVEY_ID")
 API_KEY = os.getenv("FORMBRICKS_API_KEY")
 
+REVIEW_BATCH_MAX_ITEMS = int(os.getenv("REVIEW_BATCH_MAX_ITEMS", "40"))
+REVIEW_BATCH_MAX_CHARS = int(os.getenv("REVIEW_BATCH_MAX_CHARS", "12000"))
+REVIEW_BATCH_WORKERS = int(os.getenv("REVIEW_BATCH_WORKERS", "4"))
+REVIEW_LABELS = ("good", "bad", "neutral")
+
 def classify_review(review):
     prompt = f"""
     You are a sentiment analysis expert. Carefully analyze the following customer review and classify it strictly into one of three categories:
@@ -29,8 +35,7 @@ def classify_review(review):
     """
 
     try:
-        response = gemini_model.generate_content(prompt)
-        classification = response.text.strip().lower()
+        classification = gemini_generate(prompt, cache="classify_review").strip().lower()
 
         if classification in ["good", "bad", "neutral"]:
             return classification
@@ -40,6 +45,80 @@ def classify_review(review):
         print(f"Error in classify_review: {e}")
         return "neutral"
 
+def split_review_batches(reviews):
+    """Splits (key, review) pairs into batches that respect the item and prompt-size limits."""
+    batches, batch, batch_chars = [], [], 0
+    for key, review in reviews:
+        review = review[:REVIEW_BATCH_MAX_CHARS]
+        if batch and (len(batch) >= REVIEW_BATCH_MAX_ITEMS or batch_chars + len(review) > REVIEW_BATCH_MAX_CHARS):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append((key, review))
+        batch_chars += len(review)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def classify_review_batch(batch):
+    """Classifies one batch in a single prompt; returns {key: label} for the ids the model answered."""
+    items = [{"id": f"r{i}", "review": review} for i, (_, review) in enumerate(batch)]
+    prompt = f"""
+    You are a sentiment analysis expert. Classify each customer review below strictly into one of three categories:
+
+    - "good": If the review expresses **clear satisfaction, appreciation, or positive feedback**.
+    - "bad": If the review expresses **clear dissatisfaction, complaints, frustration, or negative feedback**.
+    - "neutral": If the review is **unclear, mixed, generic, or does not strongly indicate positive or negative sentiment**.
+
+    **Reviews (JSON):**
+    {json.dumps(items, ensure_ascii=False)}
+
+    **Expected JSON Output (Strict Format, No Explanation):**
+    {{"r0": "good", "r1": "neutral"}}
+    Include every id exactly once.
+    """
+
+    response_text = gemini_generate(prompt, generation_config={"response_mime_type": "application/json"})
+    labels = json.loads(re.sub(r"```json|```", "", response_text).strip())
+    if not isinstance(labels, dict):
+        return {}
+
+    results = {}
+    for i, (key, _) in enumerate(batch):
+        label = str(labels.get(f"r{i}", "")).strip().lower()
+        if label in REVIEW_LABELS:
+            results[key] = label
+    return results
+
+def classify_reviews(reviews):
+    """
+    Classifies many reviews with one Gemini call per batch, running batches concurrently.
+    Takes (key, review) pairs and returns {key: label}; reviews a batch could not label
+    fall back to classify_review one at a time.
+    """
+    reviews = [(key, review) for key, review in reviews if review]
+    if not reviews:
+        return {}
+
+    def run(batch):
+        try:
+            return classify_review_batch(batch)
+        except Exception as e:
+            print(f"Error in classify_review_batch: {e}")
+            return {}
+
+    batches = split_review_batches(reviews)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(REVIEW_BATCH_WORKERS, len(batches)))) as executor:
+        for labels in executor.map(run, batches):
+            results.update(labels)
+
+    missing = [(key, review) for key, review in reviews if key not in results]
+    for key, review in missing:
+        results[key] = classify_review(review)
+
+    print(f"Classified {len(reviews)} reviews in {len(batches)} batches ({len(missing)} individual fallbacks)")
+    return results
+
 def extract_review(body):
     prompt = f"""
     Extract the review from the following text:
@@ -50,8 +129,7 @@ def extract_review(body):
     """
     
     try:
-        response = gemini_model.generate_content(prompt)
-        ai_response = response.text.strip()
+        ai_response = gemini_generate(prompt).strip()
         clean_response = re.sub(r"```json|```", "", ai_response).strip()
         
         return clean_response if clean_response.lower() != "no review" else None
@@ -64,7 +142,7 @@ def fetch_feedback():
         "x-api-key": API_KEY,
         "Content-Type": "application/json"
     }
-    response = requests.get(url, headers=headers)
+    response = http_session().get(url, headers=headers, timeout=30)
     data = response.json().get("data", [])
     
     return data
@@ -78,18 +156,21 @@ def store_feedback(responses):
     existing = feedback_collection.find({"id": {"$in": unique_ids}}, {"id": 1})
     existing_ids = {doc["id"] for doc in existing}
 
+    pending = [resp for resp in responses if resp["id"] not in existing_ids]
+    review_types = classify_reviews(
+        [(resp["id"], resp["data"].get("wi0bvhuydlpyygo0w5233j77")) for resp in pending]
+    )
+
     new_responses = []
-    for resp in responses:
-        if resp["id"] not in existing_ids:
-            review = resp["data"].get("wi0bvhuydlpyygo0w5233j77")
-            review_type = classify_review(review) if review else "neutral"
-            new_responses.append({
-                "id": resp["id"],
-                "email": resp["data"].get("h8h3xidx4p90mqap6n02n2bl"),
-                "review": review,
-                "type": review_type,
-                "createdAt": resp["createdAt"],
-            })
+    for resp in pending:
+        review = resp["data"].get("wi0bvhuydlpyygo0w5233j77")
+        new_responses.append({
+            "id": resp["id"],
+            "email": resp["data"].get("h8h3xidx4p90mqap6n02n2bl"),
+            "review": review,
+            "type": review_types.get(resp["id"], "neutral"),
+            "createdAt": resp["createdAt"],
+        })
     
     if new_responses:
         feedback_collection.insert_many(new_responses)
@@ -97,13 +178,14 @@ def store_feedback(responses):
     all_feedbacks = list(feedback_collection.find({}, {"_id": 0}))
     return {"feedbacks": all_feedbacks}
 
-def process_complaint(email, body, date, time):
-    review = extract_review(body)
+def process_complaint(email, body, date, time, review=None, review_type=None):
+    """Stores the review from a complaint email; review/review_type skip extraction when already known."""
+    review = review or extract_review(body)
 
     if not review:
         return {"message": "No review found, not stored"}
 
-    review_type = classify_review(review) if review else "neutral"
+    review_type = review_type or classify_review(review)
     feedback_entry = {
         "id": str(uuid.uuid4()),
         "email": email,
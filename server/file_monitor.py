@@ -3,218 +3,411 @@ import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 import json
+import threading
 from datetime import datetime, timedelta
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google.oauth2.service_account import Credentials
 from email_config.emailContentExtract import extract_email_details
-from order_handling import process_order_details, process_order_change
+from order_handling import process_order_details, process_order_change, get_commit_stats
+from inventory_reservation import get_reservation_stats
+from customer_store import get_customer_cache_stats
 from email_config.email_check import suspicious_email_check
-from email_config.email_classification import classify_email
+from email_config.email_classification import classify_email, classify_email_locally
 from feedback.feedback_handle import process_complaint
-from file_processing import process_attachment
+from file_processing import process_attachment, extract_attachment_text
+from email_extraction import EMAIL_PIPELINE, extract_email, get_extraction_stats
+from monitoring.change_detection import ChangeDetector
+from monitoring.checkpoint import CheckpointStore
+from monitoring.sheet_reader import SheetReader
+from monitoring.work_queue import WorkQueue
+from monitoring.scheduler import AdaptivePollScheduler
+from monitoring.sources import start_sources
+from monitoring.message_ledger import MessageLedger, message_fingerprint
+from monitoring.speculation import Speculation, get_speculation_stats
+from config.llm_gateway import llm_call_count, reset_llm_call_count
+import monitoring.maildir_source
 import re
 
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 SPREADSHEET_ID = "1RQCpLaxaP32BWE_cCKBWm0FWD3AvWJO8xVBaGgPQb_g"
-RANGE_NAME = "Sheet1!A1:Z1000"
+SHEET_NAME = "Sheet1"
+FULL_SCAN_EVERY = int(os.getenv("SHEET_FULL_SCAN_EVERY", "30"))
+MONITOR_WORKERS = int(os.getenv("MONITOR_WORKERS", "4"))
+WORKER_IDLE_SECONDS = float(os.getenv("WORKER_IDLE_SECONDS", "1"))
+SPECULATIVE_PIPELINE = os.getenv("SPECULATIVE_PIPELINE", "true").lower() in ("1", "true", "yes")
 
-previous_content = []
+sheet_reader = SheetReader(SPREADSHEET_ID, SHEET_NAME)
+change_detector = ChangeDetector()
+checkpoint_store = CheckpointStore("sheet")
+work_queue = WorkQueue("changes")
+poll_scheduler = AdaptivePollScheduler()
+message_ledger = MessageLedger()
+worker_stats = {"processed": 0, "failed": 0}
+worker_stats_lock = threading.Lock()
 
-def get_sheet_data():
+def get_sheet_data(full=False):
+    """
+    Returns (sheet_row_number, row) pairs: every row when full=True, otherwise only rows
+    appended since the last read. Returns None when the sheet could not be read.
+    """
     try:
-        creds = Credentials.from_service_account_file("credentials.json", scopes=SCOPES)
-        service = build("sheets", "v4", credentials=creds)
-        
-        result = (
-            service.spreadsheets()
-            .values()
-            .get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME)
-            .execute()
-        )
-        
-        rows = result.get("values", [])
-        print(f"Retrieved {len(rows)} rows from Google Sheet")
-        
-        if not rows:
-            return []
-        
-        headers = rows[0]
-        content = []
-        
-        for row in rows[1:]:
-            if not row or all(cell == '' for cell in row):
-                continue
-                
-            extended_row = row + [''] * (len(headers) - len(row))
-            
-            email_data = dict(zip(headers, extended_row))
-            content.append(email_data)
-        
-        return content
+        rows = sheet_reader.read_all() if full else sheet_reader.read_new_rows()
+        print(f"Retrieved {len(rows)} {'rows' if full else 'new rows'} from Google Sheet")
+        return rows
         
     except HttpError as error:
         print(f"An HTTP error occurred: {error}")
-        return []
+        return None
     except Exception as e:
         print(f"Error reading the Google Sheet: {e}")
-        return []
+        return None
 
-def compare_changes(new_content):
-    global previous_content
+def compare_changes(new_content, partial=False):
     changes = []
     base_timestamp = datetime.now()
     
-    prev_content_tuples = [tuple(row.items()) for row in previous_content if isinstance(row, dict)]
+    print(f"Comparing {len(new_content)} current rows with {len(change_detector.index)} previous rows")
     
-    print(f"Comparing {len(new_content)} current rows with {len(previous_content)} previous rows")
+    new_rows, modified_rows, deleted_keys = change_detector.diff(new_content, partial=partial)
     
-    for index, row in enumerate(new_content):
-        if not isinstance(row, dict):
-            continue
-            
-        row_tuple = tuple(row.items())
+    for index, (key, row) in enumerate(sorted(new_rows + modified_rows, key=lambda item: item[0])):
+        row_with_timestamp = row.copy()
+        row_with_timestamp['SheetRow'] = key
+        current_time = base_timestamp + timedelta(seconds=index)
+        row_with_timestamp['Date'] = current_time.strftime("%Y-%m-%d")
+        row_with_timestamp['Time'] = current_time.strftime("%H:%M:%S")
+        changes.append(row_with_timestamp)
         
-        if row_tuple not in prev_content_tuples:
-            row_with_timestamp = row.copy()
-            current_time = base_timestamp + timedelta(seconds=index)
-            row_with_timestamp['Date'] = current_time.strftime("%Y-%m-%d")
-            row_with_timestamp['Time'] = current_time.strftime("%H:%M:%S")
-            changes.append(row_with_timestamp)
-            
-            print("\n=== NEW OR UPDATED ROW DETECTED ===")
+        print("\n=== NEW OR UPDATED ROW DETECTED ===")
+
+    stats = change_detector.stats()
+    print(
+        f"Diffed {stats['rows_diffed']} rows in {stats['diff_seconds'] * 1000:.2f} ms "
+        f"(new: {stats['new']}, modified: {stats['modified']}, deleted: {stats['deleted']})"
+    )
 
     if changes:
         print(f"Found {len(changes)} new or updated entries")
     else:
         print("No new entries detected")
         
-    previous_content = new_content.copy()
     return changes
 
-def process_changes(changes):
-    changes_file = "changes.json"
+def parse_change(change):
+    email = None
+    body = None
+    date = change.get('Date')
+    time = change.get('Time')
+    attachment_path = None
+    subject = None
+    
+    if change.get("EmailID"):
+        email_field = change.get("EmailID")
+        email_match = re.search(r'<([^>]+)>', email_field)
+        if email_match:
+            email = email_match.group(1)
+        else:
+            email = email_field
+    else:
+        email = change.get("Email")
+    
+    if change.get("Body"):
+        body = change.get("Body")
+    
+    if change.get("Subject"):
+        subject = change.get("Subject")
+    
+    if change.get("AttachmentPath"):
+        attachment_path = change.get("AttachmentPath")
+    else:
+        attachment_path = change.get("Attachment")
+
+    return email, body, subject, attachment_path, date, time
 
+def process_change(change):
+    email, body, subject, attachment_path, date, time = parse_change(change)
+    
+    if not email or not body:
+        print(f"❌ Missing required email data. Email: {email}, Body: {body}")
+        return
+
+    fingerprint = message_fingerprint(email, subject, body, attachment_path)
+    row_key = change.get("SheetRow")
+    if message_ledger.seen(fingerprint, row_key=row_key):
+        print(f"\nSkipping email from {email}, an identical message was already processed")
+        return
+
+    reset_llm_call_count()
+    llm_calls_avoided = run_pipeline(email, body, attachment_path, date, time)
+    message_ledger.record(
+        fingerprint, sender=email.strip().lower(), llm_calls=llm_call_count(), llm_calls_avoided=llm_calls_avoided,
+        row_key=row_key,
+    )
+
+def extract_unified(email, body, attachment_path):
+    attachment_text = None
+    if attachment_path and os.path.exists(attachment_path):
+        attachment_text = extract_attachment_text(attachment_path)
+    return extract_email(body, email, attachment_text), attachment_text
+
+def start_speculation(email, body, attachment_path, date, time):
+    """
+    Starts the sender check and the classification/extraction calls together instead of one
+    after another. Extraction is skipped up front only when the local rules already say Complaint.
+    """
+    speculation = Speculation()
+    if not SPECULATIVE_PIPELINE:
+        return speculation
+
+    speculation.start("validation", suspicious_email_check, email)
+    if EMAIL_PIPELINE == "unified":
+        speculation.start("unified", extract_unified, email, body, attachment_path)
+        return speculation
+
+    has_attachment = attachment_path and os.path.exists(attachment_path)
+    if has_attachment:
+        speculation.start("attachment", process_attachment, attachment_path, body, email, date, time)
+    speculation.start("classification", classify_email, body, attachment_path)
+    if classify_email_locally(body, attachment_path) != "Complaint":
+        speculation.start("extraction", extract_email_details, body)
+    return speculation
+
+def run_unified_pipeline(email, body, attachment_path, date, time, speculation):
+    """
+    Single extraction call per email; the result feeds every downstream step.
+    Returns the number of LLM calls avoided, or None when the legacy path should run instead.
+    """
+    extraction, attachment_text = speculation.run("unified", extract_unified, email, body, attachment_path)
+    if extraction is None:
+        return None
+
+    email_type = extraction["email_type"]
+    order_details = {"customer": extraction["customer"], "orders": extraction["orders"]}
+    print(f"\nEmail type: {email_type} ({extraction['llm_calls_avoided']} LLM calls avoided)")
+
+    if email_type == "Change to order":
+        process_order_change(email, date, time, order_details)
+    elif email_type == "Order confirmation" or (attachment_text and extraction["orders"]):
+        print(json.dumps(order_details, indent=2))
+        process_order_details(email, date, time, order_details)
+    elif email_type == "Complaint":
+        process_complaint(email, body, date, time, review=extraction["review"], review_type=extraction["review_type"])
+    else:
+        print(f"\nUnknown email type: {email_type}")
+
+    return extraction["llm_calls_avoided"]
+
+def run_pipeline(email, body, attachment_path, date, time):
+    """Validates the sender, then runs the unified or legacy pipeline; returns the LLM calls avoided."""
+    speculation = start_speculation(email, body, attachment_path, date, time)
     try:
-        if changes:
-            print("\n========== PROCESSING CHANGES ==========")
-            with open(changes_file, 'w') as f:
-                json.dump(changes, f, indent=4)
-
-            for i, change in enumerate(changes):
-                email = None
-                body = None
-                date = change.get('Date')
-                time = change.get('Time')
-                attachment_path = None
-                subject = None
-                
-                if change.get("EmailID"):
-                    email_field = change.get("EmailID")
-                    email_match = re.search(r'<([^>]+)>', email_field)
-                    if email_match:
-                        email = email_match.group(1)
+        return run_stages(email, body, attachment_path, date, time, speculation)
+    finally:
+        speculation.discard()
+
+def run_stages(email, body, attachment_path, date, time, speculation):
+    print(f"\nValidating email: {email}")
+    email_status = speculation.run("validation", suspicious_email_check, email)
+    is_valid, status = email_status
+
+    if is_valid and EMAIL_PIPELINE == "unified":
+        llm_calls_avoided = run_unified_pipeline(email, body, attachment_path, date, time, speculation)
+        if llm_calls_avoided is not None:
+            return llm_calls_avoided
+        print("Unified extraction failed, falling back to the legacy pipeline")
+
+    if is_valid:
+        structured_data = None
+        if attachment_path and os.path.exists(attachment_path):
+            structured_data = speculation.run("attachment", process_attachment, attachment_path, body, email, date, time)
+
+        if structured_data and structured_data.get('orders'):
+            print(json.dumps(structured_data, indent=2))
+            process_order_details(email, date, time, structured_data)
+        else:
+            email_type, email_type_status = speculation.run("classification", classify_email, body, attachment_path)
+            
+            if email_type_status == 200:
+                if email_type == "Order confirmation":
+                    order_details = speculation.run("extraction", extract_email_details, body)
+                    if order_details:
+                        print(json.dumps(order_details, indent=2))
+                        process_order_details(email, date, time, order_details)
                     else:
-                        email = email_field
-                else:
-                    email = change.get("Email")
-                
-                if change.get("Body"):
-                    body = change.get("Body")
-                
-                if change.get("Subject"):
-                    subject = change.get("Subject")
-                
-                if change.get("AttachmentPath"):
-                    attachment_path = change.get("AttachmentPath")
-                else:
-                    attachment_path = change.get("Attachment")
-                
-                if not email or not body:
-                    print(f"❌ Missing required email data. Email: {email}, Body: {body}")
-                    continue
-                
-                print(f"\nValidating email: {email}")
-                email_status = suspicious_email_check(email)
-                is_valid, status = email_status
-
-                if is_valid:
-                    structured_data = None
-                    if attachment_path and os.path.exists(attachment_path):
-                        structured_data = process_attachment(attachment_path, body, email, date, time)
-
-                    if structured_data and structured_data.get('orders'):
-                        print(json.dumps(structured_data, indent=2))
-                        process_order_details(email, date, time, structured_data)
+                        print("No order details could be extracted from email body")
+
+                elif email_type == "Change to order":
+                    order_details = speculation.run("extraction", extract_email_details, body)
+                    if order_details:
+                        process_order_change(email, date, time, order_details)
                     else:
-                        email_type, email_type_status = classify_email(body)
-                        
-                        if email_type_status == 200:
-                            if email_type == "Order confirmation":
-                                order_details = extract_email_details(body)
-                                if order_details:
-                                    print(json.dumps(order_details, indent=2))
-                                    process_order_details(email, date, time, order_details)
-                                else:
-                                    print("No order details could be extracted from email body")
-
-                            elif email_type == "Change to order":
-                                order_details = extract_email_details(body)
-                                if order_details:
-                                    process_order_change(email, date, time, order_details)
-                                else:
-                                    print("No order change details could be extracted from email body")
-
-                            elif email_type == "Complaint":
-                                process_complaint(email, body, date, time)
-                            else:
-                                print(f"\nUnknown email type: {email_type}")
-                        else:
-                            print(f"\nFailed to classify email. Status code: {email_type_status}")
+                        print("No order change details could be extracted from email body")
+
+                elif email_type == "Complaint":
+                    process_complaint(email, body, date, time)
                 else:
-                    print('\n❌ Email validation failed:')
-                    if status == "Suspicious":
-                        print("⚠️ Warning: This email is flagged as suspicious.")
-                    elif status == "Exception":
-                        print("❗ Error: There was an issue validating the email.")
-                    else:
-                        print("ℹ️ Email is invalid or not recognized.")
-                
-    except Exception as e:
-        print(f"\nERROR processing changes: {e}")
-    finally:
-        if os.path.exists(changes_file):
-            os.remove(changes_file)
+                    print(f"\nUnknown email type: {email_type}")
+            else:
+                print(f"\nFailed to classify email. Status code: {email_type_status}")
+    else:
+        print('\n❌ Email validation failed:')
+        if status == "Suspicious":
+            print("⚠️ Warning: This email is flagged as suspicious.")
+        elif status == "Exception":
+            print("❗ Error: There was an issue validating the email.")
+        else:
+            print("ℹ️ Email is invalid or not recognized.")
 
-def start_monitoring():
-    global previous_content
-    previous_content = get_sheet_data()
-    print(f"Initialized with {len(previous_content)} existing entries")
-    
-    try:
-        cycle_count = 0
-        while True:
-            cycle_count += 1
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            current_content = get_sheet_data()
+    return 0
+
+def sender_of(change):
+    email = parse_change(change)[0]
+    return email.strip().lower() if email else None
+
+def run_worker(owner):
+    """Drains the work queue: leases one item at a time, acks on success, retries or dead-letters on failure."""
+    while True:
+        try:
+            leased = work_queue.lease(owner)
+        except Exception as e:
+            print(f"\nERROR leasing from work queue: {e}")
+            time.sleep(WORKER_IDLE_SECONDS)
+            continue
+
+        if leased is None:
+            time.sleep(WORKER_IDLE_SECONDS)
+            continue
+
+        item_id, change, attempt = leased
+        try:
+            process_change(change)
+            work_queue.ack(item_id)
+            with worker_stats_lock:
+                worker_stats["processed"] += 1
+        except Exception as e:
+            outcome = work_queue.fail(item_id, e)
+            with worker_stats_lock:
+                worker_stats["failed"] += 1
+            print(f"\nERROR processing queued item {item_id} (attempt {attempt}): {e}")
+            if outcome == "dead":
+                print(f"Item {item_id} moved to the dead-letter list")
+
+def enqueue_changes(changes):
+    """Sink shared by the sheet poller and every ingestion source."""
+    return work_queue.enqueue_many(changes, sender_of=sender_of)
+
+def start_workers():
+    running = {thread.name for thread in threading.enumerate()}
+    for i in range(MONITOR_WORKERS):
+        name = f"QueueWorker-{i}"
+        if name not in running:
+            threading.Thread(target=run_worker, args=(name,), daemon=True, name=name).start()
+
+def report_queue(previous_processed, elapsed):
+    queue_stats = work_queue.stats()
+    with worker_stats_lock:
+        processed = worker_stats["processed"]
+        failed = worker_stats["failed"]
+    ledger_stats = message_ledger.stats()
+    rate = (processed - previous_processed) / elapsed if elapsed else 0.0
+    print(
+        f"Queue: {queue_stats['pending']} pending, {queue_stats['leased']} leased, {queue_stats['dead']} dead, "
+        f"oldest {queue_stats['oldest_age_seconds']:.0f}s | workers: {processed} done, {failed} failed, "
+        f"{rate:.2f} items/s | dedup: {ledger_stats['hits']} hits, {ledger_stats['misses']} misses"
+    )
+    return processed
+
+def get_monitor_metrics():
+    """Current polling, change detection and queue metrics for the sheet monitor."""
+    with worker_stats_lock:
+        workers = dict(worker_stats)
+    return {
+        "polling": poll_scheduler.metrics(),
+        "change_detection": change_detector.stats(),
+        "queue": work_queue.stats(),
+        "workers": workers,
+        "message_ledger": message_ledger.stats(),
+        "extraction": get_extraction_stats(),
+        "speculation": get_speculation_stats(),
+        "order_commit": get_commit_stats(),
+        "reservations": get_reservation_stats(),
+        "customer_cache": get_customer_cache_stats(),
+    }
+
+def resume_from_checkpoint():
+    global change_detector
+    row_position, index = checkpoint_store.load()
+
+    if row_position is None:
+        initial_content = get_sheet_data(full=True)
+        if initial_content is None:
+            raise RuntimeError("Could not read the Google Sheet to build the initial baseline")
+        change_detector = ChangeDetector()
+        change_detector.diff(initial_content)
+        checkpoint_store.save(sheet_reader.last_row, change_detector)
+        print(f"No checkpoint found, initialized with {len(initial_content)} existing entries")
+    else:
+        change_detector = ChangeDetector(index)
+        sheet_reader.last_row = row_position
+        print(f"Resumed from checkpoint at row {row_position} with {len(index)} known rows")
+
+def run_monitor():
+    resume_from_checkpoint()
+
+    cycle_count = 0
+    last_report = time.monotonic()
+    with worker_stats_lock:
+        processed = worker_stats["processed"]
+    while True:
+        cycle_count += 1
+        full_scan = FULL_SCAN_EVERY > 0 and cycle_count % FULL_SCAN_EVERY == 0
+        api_calls_before = sheet_reader.api_calls
+        current_content = get_sheet_data(full=full_scan)
+        changes = []
+
+        if current_content is None:
+            print("\nSkipping this cycle, the sheet could not be read")
+        else:
             print("\nComparing with previous data...")
-            changes = compare_changes(current_content)
+            changes = compare_changes(current_content, partial=not full_scan)
             
             if changes:
-                print(f"\nDetected {len(changes)} new/updated entries")
-                process_changes(changes)
+                enqueued = enqueue_changes(changes)
+                print(f"\nDetected {len(changes)} new/updated entries, {enqueued} queued for processing")
             else:
                 print("\nNo changes detected in this cycle")
-            
-            wait_time = 20 
-            print(f"\nWaiting {wait_time} seconds before next check...")
-            time.sleep(wait_time)
-            
-    except KeyboardInterrupt:
-        print("\n\nMonitoring stopped by user.")
-    except Exception as e:
-        error_message = f"Error in monitoring: {str(e)}"
-        print(f"\n\nERROR: {error_message}")
-        time.sleep(10)
-        print("Restarting monitoring...")
-        start_monitoring()
+
+            checkpoint_store.save(sheet_reader.last_row, change_detector)
+
+        if full_scan:
+            message_ledger.purge_expired()
+
+        now = time.monotonic()
+        processed = report_queue(processed, now - last_report)
+        last_report = now
+
+        wait_time = poll_scheduler.record(
+            new_rows=len(changes),
+            error=current_content is None,
+            api_calls=max(1, sheet_reader.api_calls - api_calls_before),
+        )
+        metrics = poll_scheduler.metrics()
+        print(
+            f"Poll interval {metrics['interval_seconds']:.1f}s, lag {metrics['poll_lag_seconds']:.1f}s, "
+            f"{metrics['api_calls_last_minute']}/{metrics['quota_per_minute']} Sheets calls in the last minute"
+        )
+        print(f"\nWaiting {wait_time:.1f} seconds before next check...")
+        time.sleep(wait_time)
+
+def start_monitoring():
+    start_workers()
+    start_sources(enqueue_changes)
+    while True:
+        try:
+            run_monitor()
+        except KeyboardInterrupt:
+            print("\n\nMonitoring stopped by user.")
+            return
+        except Exception as e:
+            error_message = f"Error in monitoring: {str(e)}"
+            print(f"\n\nERROR: {error_message}")
+            time.sleep(10)
+            print("Restarting monitoring from last checkpoint...")
@@ -4,7 +4,7 @@ import pandas as pd
 import json
 import os
 import re
-from config.gemini_config import gemini_model
+from config.llm_gateway import gemini_generate
 
 reader = easyocr.Reader(['en'])
 
@@ -69,10 +69,10 @@ Your primary task is to **accurately extract product details from both email bod
 ### **RETURN ONLY THE JSON DATA WITHOUT ANY MARKDOWN OR CODE BLOCK MARKERS**
 """
     try:
-        response = gemini_model.generate_content(prompt)
+        response_text = gemini_generate(prompt)
 
-        if response and hasattr(response, 'text'):
-            response_text = response.text.strip()
+        if response_text:
+            response_text = response_text.strip()
             
             clean_json = re.sub(r'```json\s*|\s*```', '', response_text).strip()
             
@@ -111,19 +111,21 @@ Your primary task is to **accurately extract product details from both email bod
             "orders": []
         }
 
+def extract_attachment_text(attachment_path):
+    if attachment_path.endswith(".pdf"):
+        return extract_text_from_pdf(attachment_path)
+    elif attachment_path.endswith((".xlsx", ".xls", ".csv")):
+        return extract_data_from_excel(attachment_path)
+    elif attachment_path.endswith((".jpg", ".jpeg", ".png")):
+        return extract_text_from_image(attachment_path)
+    return ""
+
 def process_attachment(attachment_path, email_body, email, date, time):
     if not attachment_path or not os.path.exists(attachment_path):
         print("No valid attachment path provided")
         return None
     
-    extracted_data = ""
-    
-    if attachment_path.endswith(".pdf"):
-        extracted_data = extract_text_from_pdf(attachment_path)
-    elif attachment_path.endswith((".xlsx", ".xls", ".csv")):
-        extracted_data = extract_data_from_excel(attachment_path)
-    elif attachment_path.endswith((".jpg", ".jpeg", ".png")):
-        extracted_data = extract_text_from_image(attachment_path)
+    extracted_data = extract_attachment_text(attachment_path)
     
     if extracted_data:
         combined_text = f"""
@@ -0,0 +1,172 @@
+import os
+import threading
+import uuid
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from config.dbConfig import db
+from order_validation import parse_quantity
+
+load_dotenv()
+
+INVENTORY_TRANSACTIONS = os.getenv("INVENTORY_TRANSACTIONS", "auto").lower()
+# Order statuses whose products are reserved; "pending inventory" orders hold no stock
+HOLDING_STATUSES = ("pending fulfillment", "partially fulfilled")
+
+inventory_collection = db["inventory"]
+reservation_stats = {"reserved": 0, "conflicts": 0, "compensated": 0, "released": 0}
+reservation_stats_lock = threading.Lock()
+_transactions_supported = None
+
+class ReservationConflict(Exception):
+    pass
+
+def _count(key):
+    with reservation_stats_lock:
+        reservation_stats[key] += 1
+
+def supports_transactions():
+    """True when connected to a replica set or sharded cluster (INVENTORY_TRANSACTIONS=auto|on|off)."""
+    global _transactions_supported
+    if INVENTORY_TRANSACTIONS in ("on", "true"):
+        return True
+    if INVENTORY_TRANSACTIONS in ("off", "false"):
+        return False
+    if _transactions_supported is None:
+        try:
+            hello = db.client.admin.command("hello")
+            _transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except Exception as e:
+            print(f"Could not detect replica set, reserving without transactions: {e}")
+            _transactions_supported = False
+    return _transactions_supported
+
+def requested_quantities(order_details):
+    requested = {}
+    for order in order_details:
+        requested[order["product"]] = requested.get(order["product"], 0) + order["quantity"]
+    return requested
+
+def inventory_snapshot(products):
+    """Quantity and price of the given products in one $in query, keyed by name."""
+    return {
+        item["name"]: item
+        for item in inventory_collection.find({"name": {"$in": list(products)}}, {"_id": 0, "name": 1, "quantity": 1, "price": 1})
+    }
+
+def current_shortfalls(requested, snapshot=None):
+    snapshot = inventory_snapshot(requested) if snapshot is None else snapshot
+    available = {name: item.get("quantity", 0) for name, item in snapshot.items()}
+    return [
+        {"product": product, "requested": quantity, "available": max(available.get(product, 0), 0)}
+        for product, quantity in requested.items()
+        if available.get(product, 0) < quantity
+    ]
+
+def _reserve_in_transaction(requested):
+    operations = [
+        UpdateOne({"name": product, "quantity": {"$gte": quantity}}, {"$inc": {"quantity": -quantity}})
+        for product, quantity in requested.items()
+    ]
+
+    def reserve(session):
+        result = inventory_collection.bulk_write(operations, ordered=False, session=session)
+        if result.modified_count != len(operations):
+            raise ReservationConflict()
+
+    with db.client.start_session() as session:
+        session.with_transaction(reserve)
+
+def _reserve_with_compensation(requested):
+    """
+    Conditional decrements tagged with a reservation token. When only some of them apply, the
+    tagged documents are incremented back in one bulk write; on success the tags are cleared.
+    """
+    token = uuid.uuid4().hex
+    tag = f"reservations.{token}"
+    result = inventory_collection.bulk_write([
+        UpdateOne(
+            {"name": product, "quantity": {"$gte": quantity}},
+            {"$inc": {"quantity": -quantity}, "$set": {tag: quantity}},
+        )
+        for product, quantity in requested.items()
+    ], ordered=False)
+
+    if result.modified_count == len(requested):
+        inventory_collection.update_many({"name": {"$in": list(requested)}, tag: {"$exists": True}}, {"$unset": {tag: ""}})
+        return
+
+    if result.modified_count:
+        inventory_collection.bulk_write([
+            UpdateOne({"name": product, tag: quantity}, {"$inc": {"quantity": quantity}, "$unset": {tag: ""}})
+            for product, quantity in requested.items()
+        ], ordered=False)
+        _count("compensated")
+    raise ReservationConflict()
+
+def reserve_stock(order_details):
+    """
+    Atomically decrements stock for every line item, or for none of them.
+    Returns (reserved, shortfalls): reserved maps product -> quantity and is None when some
+    item could not be covered, in which case shortfalls lists those items as in check_availability.
+    """
+    requested = requested_quantities(order_details)
+    if not requested:
+        return {}, []
+
+    try:
+        if supports_transactions():
+            _reserve_in_transaction(requested)
+        else:
+            _reserve_with_compensation(requested)
+    except ReservationConflict:
+        _count("conflicts")
+        return None, current_shortfalls(requested)
+
+    _count("reserved")
+    return requested, []
+
+def release_stock(reserved):
+    """Returns reserved quantities to inventory, e.g. when the order insert fails after reserving."""
+    if not reserved:
+        return
+    inventory_collection.bulk_write([
+        UpdateOne({"name": product}, {"$inc": {"quantity": quantity}})
+        for product, quantity in reserved.items()
+    ], ordered=False)
+    _count("released")
+
+def order_quantities(products):
+    """Product -> quantity for stored order lines ({"name", "quantity"}); unreadable quantities are skipped."""
+    quantities = {}
+    for item in products or []:
+        quantity, _ = parse_quantity(item.get("quantity"))
+        if item.get("name") and quantity:
+            quantities[item["name"]] = quantities.get(item["name"], 0) + quantity
+    return quantities
+
+def adjust_reservation(previous, current):
+    """
+    Moves an order's reservation from previous to current (product -> quantity): the increases
+    are reserved like a new order (all or none), and the decreases are released once that succeeded.
+    Returns the shortfalls of the increases, empty when the reservation was adjusted.
+    """
+    increases = [
+        {"product": product, "quantity": quantity - previous.get(product, 0)}
+        for product, quantity in current.items()
+        if quantity > previous.get(product, 0)
+    ]
+    decreases = {
+        product: quantity - current.get(product, 0)
+        for product, quantity in previous.items()
+        if quantity > current.get(product, 0)
+    }
+    if increases:
+        reserved, shortfalls = reserve_stock(increases)
+        if reserved is None:
+            return shortfalls
+    release_stock(decreases)
+    return []
+
+def get_reservation_stats():
+    with reservation_stats_lock:
+        return dict(reservation_stats)
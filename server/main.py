@@ -6,7 +6,10 @@ import threading
 import uuid
 import os
 from new_file_monitor import start_monitoring
-from config.dbConfig import db
+from config.dbConfig import db, ping
+from product_matcher import product_index
+from customer_store import update_customer_order_status
+from inventory_reservation import reserve_stock, release_stock, order_quantities, HOLDING_STATUSES
 from feedback.feedback_handle import fetch_feedback, store_feedback
 from chatbot import ask_bot, refresh_data_and_update_vector_store, store_chat_history, get_chat_history
 from flask_cors import CORS
@@ -26,6 +29,7 @@ from dotenv import load_dotenv
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 SPREADSHEET_ID = 'YOUR_SPREADSHEET_ID'
 RANGE_NAME = 'Sheet1!A1:Z'
+PLACED_DAY = {"$dateToString": {"format": "%Y-%m-%d", "date": "$placed_at"}}
 
 class JSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -72,6 +76,11 @@ def before_request():
 def index():
     return 'File Monitoring is Already Running!', 200
 
+@app.route('/health')
+def health():
+    database = ping()
+    return jsonify({"database": database}), 200 if database["ok"] else 503
+
 @app.route('/get-feedback')
 def get_feedback():
     try:
@@ -261,7 +270,7 @@ def get_product_analytics():
         feedback_collection = db['feedback']
         
         pipeline_best = [
-            {"$match": {"date": {"$gte": thirty_days_ago.strftime('%Y-%m-%d')}}},
+            {"$match": {"placed_at": {"$gte": thirty_days_ago}}},
             {"$unwind": "$products"},
             {"$group": {"_id": "$products.name", "quantity": {"$sum": "$products.quantity"}}},
             {"$sort": {"quantity": -1}},
@@ -270,7 +279,7 @@ def get_product_analytics():
         best_selling = list(orders_collection.aggregate(pipeline_best))
         
         pipeline_worst = [
-            {"$match": {"date": {"$gte": thirty_days_ago.strftime('%Y-%m-%d')}}},
+            {"$match": {"placed_at": {"$gte": thirty_days_ago}}},
             {"$unwind": "$products"},
             {"$group": {"_id": "$products.name", "quantity": {"$sum": "$products.quantity"}}},
             {"$sort": {"quantity": 1}},
@@ -279,7 +288,7 @@ def get_product_analytics():
         worst_selling = list(orders_collection.aggregate(pipeline_worst))
         
         pipeline_revenue = [
-            {"$match": {"date": {"$gte": thirty_days_ago.strftime('%Y-%m-%d')}}},
+            {"$match": {"placed_at": {"$gte": thirty_days_ago}}},
             {"$addFields": {
                 "total_amount": {"$sum": {"$map": {
                     "input": "$products",
@@ -287,7 +296,7 @@ def get_product_analytics():
                     "in": {"$multiply": ["$$product.price", "$$product.quantity"]}
                 }}}
             }},
-            {"$group": {"_id": "$date", "revenue": {"$sum": "$total_amount"}}},
+            {"$group": {"_id": PLACED_DAY, "revenue": {"$sum": "$total_amount"}}},
             {"$sort": {"_id": 1}}
         ]
         revenue_per_day = list(orders_collection.aggregate(pipeline_revenue))
@@ -324,14 +333,14 @@ def get_customer_analytics():
         orders_collection = db['orders']
         
         pipeline_trends = [
-            {"$match": {"date": {"$gte": thirty_days_ago.strftime('%Y-%m-%d')}}},
-            {"$group": {"_id": "$date", "count": {"$sum": 1}}},
+            {"$match": {"placed_at": {"$gte": thirty_days_ago}}},
+            {"$group": {"_id": PLACED_DAY, "count": {"$sum": 1}}},
             {"$sort": {"_id": 1}}
         ]
         order_trends = list(orders_collection.aggregate(pipeline_trends))
         
         pipeline_frequent = [
-            {"$match": {"date": {"$gte": thirty_days_ago.strftime('%Y-%m-%d')}}},
+            {"$match": {"placed_at": {"$gte": thirty_days_ago}}},
             {"$group": {"_id": "$name", "order_count": {"$sum": 1}}},
             {"$sort": {"order_count": -1}},
             {"$limit": 10}
@@ -339,19 +348,7 @@ def get_customer_analytics():
         frequent_customers = list(orders_collection.aggregate(pipeline_frequent))
         
         pipeline_spenders = [
-            {"$match": {"date": {"$gte": thirty_days_ago.strftime('%Y-%m-%d')}}},
-            {"$unwind": "$products"},
-            {"$addFields": {
-                "item_total": {"$multiply": ["$products.price", "$products.quantity"]}
-            }},
-            {"$group": {
-                "_id": "$name", 
-                "total_spent": {"$sum": "$item_total"}
-            }},
-            {"$sort": {"total_spent": -1}},
-            {"$limit": 10}
-        ]
-            {"$match": {"date": {"$gte": thirty_days_ago.strftime('%Y-%m-%d')}}},
+            {"$match": {"placed_at": {"$gte": thirty_days_ago}}},
             {"$unwind": "$products"},
             {"$addFields": {
                 "item_total": {"$multiply": ["$products.price", "$products.quantity"]}
@@ -393,7 +390,7 @@ def get_customer_analytics():
 def get_orders():
     try:
         orders_collection = db['orders']
-        orders = list(orders_collection.find({}).sort([('date', -1), ('time', -1)]))  # Sort in descending order of date and time
+        orders = list(orders_collection.find({}).sort('placed_at', -1))  # Most recent orders first
         
         for order in orders:
             order['_id'] = str(order['_id'])
@@ -405,7 +402,7 @@ def get_orders():
         return jsonify({'error': str(e)}), 500
     try:
         orders_collection = db['orders']
-        orders = list(orders_collection.find({}).sort([('date', -1), ('time', -1)]))  # Sort in descending order of date and time
+        orders = list(orders_collection.find({}).sort('placed_at', -1))  # Most recent orders first
         
         for order in orders:
             order['_id'] = str(order['_id'])
@@ -440,41 +437,14 @@ def handle_status_update():
         if not existing_order:
             return jsonify({"error": "Order not found"}), 404
 
-        result = orders_collection.update_one(
-            {"_id": order_id},
-            {"$set": {"status": new_status}}
-        )
-
-        if result.modified_count == 0:
-            return jsonify({"error": "Status not changed (already set or issue with update)"}), 400
-
-        if new_status.lower() == "fulfilled":
-            try:
-                send_invoice(order_id=order_id)
-            except Exception as e:
-                print(f"Error sending invoice: {e}")
-                return jsonify({"error": f"Failed to send invoice: {str(e)}"}), 500
-
-        return jsonify({"success": True, "message": "Order status updated successfully"}), 200
-
-    try:
-        data = request.get_json()
-        order_id = data.get('orderId')
-        new_status = data.get('status')
-
-        if not order_id or not new_status:
-            return jsonify({"error": "Order ID and status are required"}), 400
-
-        try:
-            order_id = ObjectId(order_id)
-        except Exception as e:
-            return jsonify({"error": f"Invalid ObjectId format: {e}"}), 400
-
-        orders_collection = db['orders']
-        existing_order = orders_collection.find_one({"_id": order_id})
-
-        if not existing_order:
-            return jsonify({"error": "Order not found"}), 404
+        # Pending-inventory orders hold no stock: reserve it when the order is confirmed
+        old_status = (existing_order.get("status") or "").lower()
+        quantities = order_quantities(existing_order.get("products"))
+        reserved = None
+        if old_status == "pending inventory" and new_status.lower() in HOLDING_STATUSES:
+            reserved, shortfalls = reserve_stock([{"product": name, "quantity": quantity} for name, quantity in quantities.items()])
+            if reserved is None:
+                return jsonify({"error": "Not enough stock to confirm this order", "shortfalls": shortfalls}), 409
 
         result = orders_collection.update_one(
             {"_id": order_id},
@@ -482,7 +452,12 @@ def handle_status_update():
         )
 
         if result.modified_count == 0:
+            release_stock(reserved)
             return jsonify({"error": "Status not changed (already set or issue with update)"}), 400
+        update_customer_order_status(order_id, new_status)
+
+        if new_status.lower() == "cancelled" and old_status in HOLDING_STATUSES:
+            release_stock(quantities)
 
         if new_status.lower() == "fulfilled":
             try:
@@ -498,11 +473,6 @@ def handle_status_update():
         handle_exception(e)
         return jsonify({'error': str(e)}), 500
 
-    except Exception as e:
-        print(f"General error: {e}")
-        handle_exception(e)
-        return jsonify({'error': str(e)}), 500
-
 @app.route('/get-inventory')
 def get_inventory():
     try:
@@ -548,6 +518,7 @@ def add_inventory():
                 return jsonify({"error": f"Missing required field: {field}"}), 400
         
         result = inventory_collection.insert_one(data)
+        product_index.invalidate()
         
         new_item = data
         new_item['_id'] = str(result.inserted_id)
@@ -575,6 +546,7 @@ def update_inventory(item_id):
         
         if result.matched_count == 0:
             return jsonify({"error": "Item not found"}), 404
+        product_index.invalidate()
             
         updated_item = inventory_collection.find_one({"_id": ObjectId(item_id)})
         updated_item['_id'] = str(updated_item['_id'])
@@ -594,6 +566,7 @@ def delete_inventory(item_id):
         
         if result.deleted_count == 0:
             return jsonify({"error": "Item not found"}), 404
+        product_index.invalidate()
         
         return jsonify({"message": "Item deleted successfully"}), 200
     except Exception as e:
@@ -0,0 +1,80 @@
+"""
+Backfills placed_at and fingerprint on orders stored before those fields existed, then
+creates the order indexes. Run from the server directory:
+
+    python -m migrations.backfill_placed_at [--dry-run] [--batch-size 500]
+
+Orders whose date/time strings cannot be parsed get the creation time of their ObjectId,
+in local time.
+The migration only touches documents missing a field, so it is safe to re-run.
+"""
+import argparse
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from pymongo import UpdateOne
+from config.dbConfig import db
+from config.db_indexes import ensure_indexes
+from order_keys import parse_placed_at, order_fingerprint
+from order_validation import parse_quantity
+
+def backfill(batch_size=500, dry_run=False):
+    orders_collection = db["orders"]
+    query = {"$or": [{"placed_at": {"$exists": False}}, {"fingerprint": {"$exists": False}}]}
+    projection = {"email": 1, "date": 1, "time": 1, "products": 1, "placed_at": 1, "fingerprint": 1}
+
+    scanned, updated, unparseable, skipped_lines = 0, 0, 0, 0
+    operations = []
+    for order in orders_collection.find(query, projection):
+        scanned += 1
+        fields = {}
+
+        if "placed_at" not in order:
+            placed_at = parse_placed_at(order.get("date"), order.get("time"))
+            if placed_at is None:
+                unparseable += 1
+                # generation_time is UTC; placed_at is naive local time like the parsed date/time strings
+                placed_at = order["_id"].generation_time.astimezone().replace(tzinfo=None)
+            fields["placed_at"] = placed_at
+
+        if "fingerprint" not in order:
+            lines = []
+            for item in order.get("products") or []:
+                if not isinstance(item, dict) or not item.get("name"):
+                    continue
+                quantity, _ = parse_quantity(item.get("quantity"))
+                if quantity is None:
+                    skipped_lines += 1
+                    print(f"Order {order['_id']}: skipping line {item.get('name')!r} with unreadable quantity {item.get('quantity')!r}")
+                    continue
+                lines.append({"product": item["name"], "quantity": quantity})
+            fields["fingerprint"] = order_fingerprint(order.get("email"), lines)
+
+        operations.append(UpdateOne({"_id": order["_id"]}, {"$set": fields}))
+        if len(operations) >= batch_size:
+            updated += flush(orders_collection, operations, dry_run)
+            operations = []
+
+    updated += flush(orders_collection, operations, dry_run)
+
+    if not dry_run:
+        ensure_indexes(db, ["orders"])
+
+    print(f"Scanned {scanned} orders, updated {updated}, {unparseable} with unparseable date/time, "
+          f"{skipped_lines} lines with unreadable quantities left out of fingerprints"
+          f"{' (dry run, nothing written)' if dry_run else ''}")
+    return updated
+
+def flush(collection, operations, dry_run):
+    if not operations:
+        return 0
+    if dry_run:
+        return len(operations)
+    return collection.bulk_write(operations, ordered=False).modified_count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill placed_at and fingerprint on existing orders")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    backfill(batch_size=args.batch_size, dry_run=args.dry_run)
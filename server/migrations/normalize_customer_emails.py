@@ -0,0 +1,80 @@
+"""
+Sets email_normalized on existing customers, merges customers that share a normalized email,
+and creates the unique index. Run from the server directory:
+
+    python -m migrations.normalize_customer_emails [--dry-run]
+
+For each duplicate group the customer that already has email_normalized (or else the oldest)
+is kept; the others' past_orders and customer_orders history are moved to it, empty fields are
+filled from them, and they are deleted.
+"""
+import argparse
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from config.dbConfig import db
+from config.db_indexes import ensure_indexes
+from customer_store import customers_collection, customer_orders_collection, normalize_email, CUSTOMER_FIELDS
+
+def normalize(dry_run=False):
+    groups = {}
+    for customer in customers_collection.find({}, {"past_orders": 0}):
+        key = normalize_email(customer.get("email_normalized") or customer.get("email"))
+        if key:
+            groups.setdefault(key, []).append(customer)
+
+    tagged, merged = 0, 0
+    for key, customers in groups.items():
+        customers.sort(key=lambda customer: (customer.get("email_normalized") != key, customer["_id"]))
+        keeper, duplicates = customers[0], customers[1:]
+
+        fields = {} if keeper.get("email_normalized") == key else {"email_normalized": key}
+        for field in CUSTOMER_FIELDS:
+            if not keeper.get(field):
+                value = next((customer.get(field) for customer in duplicates if customer.get(field)), None)
+                if value:
+                    fields[field] = value
+
+        past_orders = []
+        for duplicate in duplicates:
+            document = customers_collection.find_one({"_id": duplicate["_id"]}, {"past_orders": 1})
+            past_orders.extend(document.get("past_orders") or [])
+
+        if dry_run:
+            tagged += "email_normalized" in fields
+            merged += len(duplicates)
+            continue
+
+        update = {}
+        if fields:
+            update["$set"] = fields
+        if past_orders:
+            update["$push"] = {"past_orders": {"$each": past_orders}}
+        if update:
+            customers_collection.update_one({"_id": keeper["_id"]}, update)
+            tagged += "email_normalized" in fields
+
+        if duplicates:
+            duplicate_ids = [customer["_id"] for customer in duplicates]
+            moved = customer_orders_collection.update_many(
+                {"customer_id": {"$in": duplicate_ids}}, {"$set": {"customer_id": keeper["_id"]}}
+            ).modified_count
+            if moved:
+                customers_collection.update_one({"_id": keeper["_id"]}, {"$inc": {
+                    "order_count": sum(customer.get("order_count") or 0 for customer in duplicates),
+                    "lifetime_spend": sum(customer.get("lifetime_spend") or 0 for customer in duplicates),
+                }})
+            customers_collection.delete_many({"_id": {"$in": duplicate_ids}})
+            merged += len(duplicates)
+
+    if not dry_run:
+        ensure_indexes(db, ["customers"])
+
+    print(f"Tagged {tagged} customers, merged {merged} duplicates into {len(groups)} customers"
+          f"{' (dry run, nothing written)' if dry_run else ''}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalize customer emails and merge duplicate customers")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    normalize(dry_run=args.dry_run)
@@ -0,0 +1,101 @@
+"""
+Moves the embedded customers.past_orders arrays into the customer_orders collection and
+replaces them with order_count, lifetime_spend and last_order. Run from the server directory:
+
+    python -m migrations.split_customer_orders [--dry-run] [--batch-size 500]
+
+Run migrations.normalize_customer_emails first so duplicate customers are already merged.
+Order totals come from the orders collection (sum of price x quantity) when the summary has none.
+Re-running is safe: summaries are upserted by order_id and migrated customers no longer match.
+"""
+import argparse
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from bson import ObjectId
+from pymongo import UpdateOne
+from config.dbConfig import db
+from config.db_indexes import ensure_indexes
+from customer_store import customers_collection, customer_orders_collection, UNCOMMITTED_STATUSES
+from order_keys import parse_placed_at
+from order_validation import parse_quantity
+
+orders_collection = db["orders"]
+
+def order_totals(order_ids):
+    object_ids = [ObjectId(order_id) for order_id in order_ids if ObjectId.is_valid(order_id)]
+    totals = {}
+    for order in orders_collection.find({"_id": {"$in": object_ids}}, {"products": 1, "total": 1, "placed_at": 1}):
+        total = order.get("total")
+        if total is None:
+            total = 0
+            for item in order.get("products") or []:
+                quantity, _ = parse_quantity(item.get("quantity"))
+                if quantity is None:
+                    print(f"Order {order['_id']}: line {item.get('name')!r} has unreadable quantity {item.get('quantity')!r}, left out of the total")
+                    continue
+                total += (item.get("price") or 0) * quantity
+        totals[str(order["_id"])] = (total, order.get("placed_at"))
+    return totals
+
+def customer_aggregates(customer_id):
+    """order_count, lifetime_spend and last_order recomputed from the customer's customer_orders."""
+    result = list(customer_orders_collection.aggregate([
+        {"$match": {"customer_id": customer_id}},
+        {"$sort": {"placed_at": -1}},
+        {"$group": {
+            "_id": None,
+            "order_count": {"$sum": 1},
+            "lifetime_spend": {"$sum": {"$cond": [
+                {"$in": [{"$toLower": {"$ifNull": ["$status", ""]}}, list(UNCOMMITTED_STATUSES)]},
+                0,
+                {"$ifNull": ["$total", 0]},
+            ]}},
+            "last_order": {"$first": {"order_id": "$order_id", "placed_at": "$placed_at", "total": "$total", "status": "$status"}},
+        }},
+    ]))
+    if not result:
+        return {"order_count": 0, "lifetime_spend": 0}
+    result[0].pop("_id")
+    return result[0]
+
+def split(batch_size=500, dry_run=False):
+    customers, moved = 0, 0
+    for customer in customers_collection.find({"past_orders": {"$exists": True}}, {"past_orders": 1}):
+        past_orders = customer.get("past_orders") or []
+        totals = order_totals([str(summary.get("order_id")) for summary in past_orders])
+
+        operations = []
+        for summary in past_orders:
+            order_id = str(summary.get("order_id"))
+            total, placed_at = totals.get(order_id, (0, None))
+            summary = dict(summary, order_id=order_id, customer_id=customer["_id"])
+            summary.setdefault("total", total)
+            summary.setdefault("placed_at", placed_at or parse_placed_at(summary.get("date"), summary.get("time")))
+            operations.append(UpdateOne({"order_id": order_id}, {"$setOnInsert": summary}, upsert=True))
+
+        customers += 1
+        moved += len(operations)
+        if dry_run:
+            continue
+
+        for start in range(0, len(operations), batch_size):
+            customer_orders_collection.bulk_write(operations[start:start + batch_size], ordered=False)
+
+        customers_collection.update_one(
+            {"_id": customer["_id"]},
+            {"$set": customer_aggregates(customer["_id"]), "$unset": {"past_orders": ""}},
+        )
+
+    if not dry_run:
+        ensure_indexes(db, ["customers", "customer_orders"])
+
+    print(f"Moved {moved} order summaries from {customers} customers"
+          f"{' (dry run, nothing written)' if dry_run else ''}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move customers.past_orders into the customer_orders collection")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    split(batch_size=args.batch_size, dry_run=args.dry_run)
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import time
+
+
+def row_digest(row):
+    """Stable content hash of a sheet row (column order independent)."""
+    payload = json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ChangeDetector:
+    """
+    Keeps a row key -> content digest index and diffs each new snapshot against it in O(n).
+
+    A row whose content already exists elsewhere in the index (e.g. it only moved because a row
+    above it was deleted) is not reported again, matching the old content based comparison.
+    """
+
+    def __init__(self, index=None):
+        self.index = dict(index or {})
+        self.dirty_keys = set()
+        self.removed_keys = set()
+        self.last_stats = {"rows_diffed": 0, "new": 0, "modified": 0, "deleted": 0, "diff_seconds": 0.0}
+        self.total_rows_diffed = 0
+        self.total_diff_seconds = 0.0
+
+    def diff(self, keyed_rows, partial=False):
+        """
+        Diff (key, row) pairs against the index and update it.
+
+        With partial=True only the given keys are considered, so rows missing from
+        the snapshot are not reported as deleted (used for tail reads).
+        Returns (new_rows, modified_rows, deleted_keys); rows are (key, row) pairs.
+        """
+        started = time.perf_counter()
+        known_digests = set(self.index.values())
+        current = {}
+        new_rows, modified_rows = [], []
+
+        for key, row in keyed_rows:
+            if not isinstance(row, dict):
+                continue
+
+            digest = row_digest(row)
+            current[key] = digest
+            previous = self.index.get(key)
+            if previous != digest:
+                self.dirty_keys.add(key)
+                self.removed_keys.discard(key)
+
+            if previous == digest or digest in known_digests:
+                continue
+            if previous is None:
+                new_rows.append((key, row))
+            else:
+                modified_rows.append((key, row))
+
+        deleted_keys = []
+        if not partial:
+            # A row is gone when its content is no longer anywhere in the sheet and its key was not
+            # reported as modified (an in-place edit also drops the old content)
+            current_digests = set(current.values())
+            modified_keys = {key for key, _ in modified_rows}
+            deleted_keys = [
+                key for key, digest in self.index.items()
+                if digest not in current_digests and key not in modified_keys
+            ]
+            dropped_keys = self.index.keys() - current.keys()
+            self.removed_keys.update(dropped_keys)
+            self.dirty_keys.difference_update(dropped_keys)
+            self.index = current
+        else:
+            self.index.update(current)
+
+        elapsed = time.perf_counter() - started
+        self.last_stats = {
+            "rows_diffed": len(current),
+            "new": len(new_rows),
+            "modified": len(modified_rows),
+            "deleted": len(deleted_keys),
+            "diff_seconds": elapsed,
+        }
+        self.total_rows_diffed += len(current)
+        self.total_diff_seconds += elapsed
+
+        return new_rows, modified_rows, deleted_keys
+
+    def pop_dirty(self):
+        """Returns and clears index changes since the last call as ({key: digest}, removed_keys)."""
+        upserts = {key: self.index[key] for key in self.dirty_keys if key in self.index}
+        removed = set(self.removed_keys)
+        self.dirty_keys.clear()
+        self.removed_keys.clear()
+        return upserts, removed
+
+    def restore_dirty(self, upserts, removed):
+        self.dirty_keys.update(upserts)
+        self.removed_keys.update(removed)
+
+    def stats(self):
+        return {
+            **self.last_stats,
+            "indexed_rows": len(self.index),
+            "total_rows_diffed": self.total_rows_diffed,
+            "total_diff_seconds": self.total_diff_seconds,
+        }
@@ -0,0 +1,87 @@
+import time
+from config.local_store import get_connection, ensure_schema
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        source TEXT PRIMARY KEY,
+        row_position INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS row_hashes (
+        source TEXT NOT NULL,
+        row_key INTEGER NOT NULL,
+        digest TEXT NOT NULL,
+        PRIMARY KEY (source, row_key)
+    )
+    """,
+]
+
+class CheckpointStore:
+    """Durable ingestion checkpoint: last processed row position plus the row hash index."""
+
+    def __init__(self, source="sheet", path=None):
+        self.source = source
+        self.path = path
+        ensure_schema(self._conn(), SCHEMA)
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def load(self):
+        """Returns (row_position, index) or (None, {}) when no checkpoint exists yet."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT row_position FROM checkpoints WHERE source = ?", (self.source,)
+        ).fetchone()
+        if row is None:
+            return None, {}
+
+        index = {
+            item["row_key"]: item["digest"]
+            for item in conn.execute(
+                "SELECT row_key, digest FROM row_hashes WHERE source = ?", (self.source,)
+            )
+        }
+        return row["row_position"], index
+
+    def save(self, row_position, detector):
+        """Persists the detector's pending index changes and the new row position in one transaction."""
+        upserts, removed = detector.pop_dirty()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if removed:
+                conn.executemany(
+                    "DELETE FROM row_hashes WHERE source = ? AND row_key = ?",
+                    [(self.source, key) for key in removed],
+                )
+            if upserts:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO row_hashes (source, row_key, digest) VALUES (?, ?, ?)",
+                    [(self.source, key, digest) for key, digest in upserts.items()],
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (source, row_position, updated_at) VALUES (?, ?, ?)",
+                (self.source, row_position, time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            detector.restore_dirty(upserts, removed)
+            raise
+
+    def load_position(self):
+        """Position-only checkpoint (no row index), e.g. messages consumed from an mbox file; 0 when unset."""
+        row = self._conn().execute(
+            "SELECT row_position FROM checkpoints WHERE source = ?", (self.source,)
+        ).fetchone()
+        return row["row_position"] if row else 0
+
+    def save_position(self, row_position):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO checkpoints (source, row_position, updated_at) VALUES (?, ?, ?)",
+            (self.source, row_position, time.time()),
+        )
@@ -0,0 +1,172 @@
+import mailbox
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from email import policy
+from email.parser import BytesParser
+from email.utils import parsedate_to_datetime
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from monitoring.checkpoint import CheckpointStore
+from monitoring.sources import IngestionSource, register_source
+
+MAILDIR_PATH = os.getenv("MAILDIR_PATH")
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "attachments")
+MBOX_LOCK_RETRY_SECONDS = float(os.getenv("MBOX_LOCK_RETRY_SECONDS", "2"))
+SUPPORTED_ATTACHMENTS = (".pdf", ".xlsx", ".xls", ".csv", ".jpg", ".jpeg", ".png")
+
+def save_attachments(message):
+    """Writes every attachment to ATTACHMENTS_DIR and returns the saved paths."""
+    paths = []
+    for part in message.iter_attachments():
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True)
+        if not filename or payload is None:
+            continue
+
+        os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+        safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename))
+        path = os.path.join(ATTACHMENTS_DIR, f"{uuid.uuid4().hex[:12]}_{safe_name}")
+        with open(path, "wb") as f:
+            f.write(payload)
+        paths.append(path)
+    return paths
+
+def message_to_change(message, source):
+    """Converts an email.message.EmailMessage into a sheet-shaped change row."""
+    body_part = message.get_body(preferencelist=("plain", "html"))
+    body = body_part.get_content() if body_part is not None else ""
+
+    try:
+        received = parsedate_to_datetime(message["Date"]).astimezone().replace(tzinfo=None)
+    except Exception:
+        received = datetime.now()
+
+    attachments = save_attachments(message)
+    attachment = next((path for path in attachments if path.lower().endswith(SUPPORTED_ATTACHMENTS)), "")
+
+    return {
+        "EmailID": str(message["From"] or ""),
+        "Subject": str(message["Subject"] or ""),
+        "Body": body.strip(),
+        "Attachment": attachment,
+        "Date": received.strftime("%Y-%m-%d"),
+        "Time": received.strftime("%H:%M:%S"),
+        "Source": source,
+    }
+
+def parse_message_file(path, source):
+    with open(path, "rb") as f:
+        message = BytesParser(policy=policy.default).parse(f)
+    return message_to_change(message, source)
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.callback(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.callback(event.dest_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.callback(event.src_path)
+
+class MaildirSource(IngestionSource):
+    """
+    Watches a local mail directory (inotify via watchdog) and emits messages as they land.
+
+    Two layouts are supported: a maildir (new/, cur/, tmp/), whose delivered messages are moved
+    from new/ to cur/ once emitted, and a directory of *.mbox files, whose consumed message
+    count per file is kept in the local checkpoint store.
+    """
+
+    name = "maildir"
+
+    def __init__(self, path):
+        self.path = path
+        self.is_maildir = os.path.isdir(os.path.join(path, "new"))
+        self.observer = None
+        self.emit = None
+        self._lock = threading.Lock()
+
+    def start(self, emit):
+        self.emit = emit
+        watch_path = os.path.join(self.path, "new") if self.is_maildir else self.path
+        self.observer = Observer()
+        self.observer.schedule(_Handler(self._on_path), watch_path, recursive=False)
+        self.observer.daemon = True
+        self.observer.start()
+        self.scan()
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+
+    def scan(self):
+        """Emits everything already waiting in the directory (backlog from before startup)."""
+        watch_path = os.path.join(self.path, "new") if self.is_maildir else self.path
+        for entry in sorted(os.listdir(watch_path)):
+            self._on_path(os.path.join(watch_path, entry))
+
+    def _on_path(self, path):
+        try:
+            with self._lock:
+                if self.is_maildir:
+                    self._ingest_maildir_file(path)
+                elif path.endswith(".mbox"):
+                    self._ingest_mbox(path)
+        except Exception as e:
+            print(f"Error ingesting mail from {path}: {e}")
+
+    def _ingest_maildir_file(self, path):
+        if os.path.dirname(path) != os.path.join(self.path, "new") or not os.path.isfile(path):
+            return
+        change = parse_message_file(path, self.name)
+        self.emit([change])
+        # Maildir convention: seen messages live in cur/ with an info suffix.
+        os.makedirs(os.path.join(self.path, "cur"), exist_ok=True)
+        os.replace(path, os.path.join(self.path, "cur", os.path.basename(path) + ":2,S"))
+
+    def _ingest_mbox(self, path):
+        store = CheckpointStore(f"mbox:{os.path.abspath(path)}")
+        consumed = store.load_position()
+
+        box = mailbox.mbox(path, factory=lambda f: BytesParser(policy=policy.default).parse(f), create=False)
+        try:
+            # Same dot/flock locking as the delivering MTA, so a message still being appended is never read
+            box.lock()
+        except mailbox.ExternalClashError:
+            box.close()
+            print(f"{path} is locked by another process, retrying in {MBOX_LOCK_RETRY_SECONDS}s")
+            retry = threading.Timer(MBOX_LOCK_RETRY_SECONDS, self._on_path, [path])
+            retry.daemon = True
+            retry.start()
+            return
+        try:
+            keys = box.keys()
+            changes = [message_to_change(box[key], self.name) for key in keys[consumed:]]
+        finally:
+            box.unlock()
+            box.close()
+
+        if changes:
+            self.emit(changes)
+            store.save_position(consumed + len(changes))
+
+def _maildir_from_env():
+    if not MAILDIR_PATH:
+        return None
+    if not os.path.isdir(MAILDIR_PATH):
+        print(f"MAILDIR_PATH {MAILDIR_PATH} is not a directory, maildir ingestion disabled")
+        return None
+    return MaildirSource(MAILDIR_PATH)
+
+register_source("maildir", _maildir_from_env)
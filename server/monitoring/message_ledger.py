@@ -0,0 +1,151 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from config.local_store import get_connection, ensure_schema, ensure_column
+
+LEDGER_TTL_HOURS = float(os.getenv("MESSAGE_LEDGER_TTL_HOURS", "72"))
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS processed_messages (
+        fingerprint TEXT PRIMARY KEY,
+        sender TEXT,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        llm_calls INTEGER,
+        llm_calls_avoided INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_processed_messages_first_seen ON processed_messages (first_seen)",
+    """
+    CREATE TABLE IF NOT EXISTS sheet_row_messages (
+        row_key INTEGER PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+]
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", str(text or "")).strip().lower()
+
+def _attachment_digest(attachment_path):
+    if not attachment_path:
+        return ""
+    if not os.path.isfile(attachment_path):
+        return os.path.basename(attachment_path)
+    digest = hashlib.sha256()
+    with open(attachment_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def message_fingerprint(sender, subject, body, attachment_path=None):
+    """Hash of the normalized sender, subject, body and attachment content, ignoring whitespace and case."""
+    match = re.search(r"<([^<>]+)>", sender or "")
+    parts = [
+        _normalize(match.group(1) if match else sender),
+        _normalize(subject),
+        _normalize(body),
+        _attachment_digest(attachment_path),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+class MessageLedger:
+    """
+    Ledger of messages that already went through the pipeline.
+
+    Entries expire after ttl_hours so a customer deliberately re-sending an identical email
+    later is processed again; within the window, re-detected rows are skipped.
+    Sheet rows additionally remember the fingerprint processed for their row number, without
+    expiry, so editing another cell of an old row (e.g. a status column) never re-runs it.
+    """
+
+    def __init__(self, path=None, ttl_hours=LEDGER_TTL_HOURS):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.hits = 0
+        self.misses = 0
+        self.llm_calls_saved = 0
+        self.llm_calls_avoided = 0
+        self._lock = threading.Lock()
+        ensure_schema(self._conn(), SCHEMA)
+        ensure_column(self._conn(), "processed_messages", "llm_calls_avoided", "INTEGER")
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def seen(self, fingerprint, row_key=None):
+        """
+        Returns True (and counts a hit) when the message was processed within the TTL window,
+        or was the last message processed for sheet row row_key.
+        """
+        now = time.time()
+        conn = self._conn()
+        row = None
+        if row_key is not None and self.row_fingerprint(row_key) == fingerprint:
+            row = conn.execute(
+                "SELECT llm_calls FROM processed_messages WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone() or {"llm_calls": 0}
+        if row is None:
+            row = conn.execute(
+                "SELECT llm_calls FROM processed_messages WHERE fingerprint = ? AND first_seen >= ?",
+                (fingerprint, now - self.ttl_seconds),
+            ).fetchone()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return False
+            self.hits += 1
+            self.llm_calls_saved += row["llm_calls"] or 0
+
+        conn.execute(
+            "UPDATE processed_messages SET hits = hits + 1, last_seen = ? WHERE fingerprint = ?",
+            (now, fingerprint),
+        )
+        return True
+
+    def row_fingerprint(self, row_key):
+        row = self._conn().execute(
+            "SELECT fingerprint FROM sheet_row_messages WHERE row_key = ?", (row_key,)
+        ).fetchone()
+        return row["fingerprint"] if row else None
+
+    def record(self, fingerprint, sender=None, llm_calls=None, llm_calls_avoided=None, row_key=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO processed_messages "
+            "(fingerprint, sender, first_seen, last_seen, hits, llm_calls, llm_calls_avoided) "
+            "VALUES (?, ?, ?, ?, 0, ?, ?)",
+            (fingerprint, sender, now, now, llm_calls, llm_calls_avoided),
+        )
+        if row_key is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO sheet_row_messages (row_key, fingerprint, updated_at) VALUES (?, ?, ?)",
+                (row_key, fingerprint, now),
+            )
+        if llm_calls_avoided:
+            with self._lock:
+                self.llm_calls_avoided += llm_calls_avoided
+
+    def purge_expired(self):
+        cursor = self._conn().execute(
+            "DELETE FROM processed_messages WHERE first_seen < ?", (time.time() - self.ttl_seconds,)
+        )
+        return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "llm_calls_saved": self.llm_calls_saved,
+                "llm_calls_avoided": self.llm_calls_avoided,
+            }
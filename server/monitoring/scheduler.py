@@ -0,0 +1,84 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL_SECONDS", "5"))
+BASE_INTERVAL = float(os.getenv("POLL_BASE_INTERVAL_SECONDS", "20"))
+MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL_SECONDS", "600"))
+QUOTA_PER_MINUTE = int(os.getenv("POLL_QUOTA_PER_MINUTE", "30"))
+
+class AdaptivePollScheduler:
+    """
+    Picks the delay before the next poll.
+
+    The interval halves (down to min_interval) while polls keep finding new rows, grows
+    exponentially while the source is idle or erroring (up to max_interval), and never lets
+    the number of API calls in the last 60 seconds exceed quota_per_minute.
+    """
+
+    def __init__(self, min_interval=MIN_INTERVAL, base_interval=BASE_INTERVAL, max_interval=MAX_INTERVAL,
+                 quota_per_minute=QUOTA_PER_MINUTE, idle_backoff=1.5, error_backoff=2.0):
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.quota_per_minute = quota_per_minute
+        self.idle_backoff = idle_backoff
+        self.error_backoff = error_backoff
+        self.interval = base_interval
+        self.consecutive_errors = 0
+        self.calls = deque()
+        self.last_poll_at = None
+        self.last_new_rows_at = None
+        self.last_lag_seconds = 0.0
+        self.planned_wait = 0.0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self.calls and now - self.calls[0] >= 60:
+            self.calls.popleft()
+
+    def record(self, new_rows=0, error=False, api_calls=1):
+        """Feeds back the outcome of a poll and returns the seconds to wait before the next one."""
+        now = time.monotonic()
+        with self._lock:
+            if self.last_poll_at is not None:
+                self.last_lag_seconds = max(0.0, now - self.last_poll_at - self.planned_wait)
+            self.last_poll_at = now
+            self.calls.extend([now] * api_calls)
+            self._prune(now)
+
+            if error:
+                self.consecutive_errors += 1
+                self.interval = min(self.max_interval, max(self.interval, self.base_interval) * self.error_backoff)
+            elif new_rows:
+                self.consecutive_errors = 0
+                self.last_new_rows_at = now
+                self.interval = max(self.min_interval, min(self.interval, self.base_interval) / 2)
+            else:
+                self.consecutive_errors = 0
+                self.interval = min(self.max_interval, self.interval * self.idle_backoff)
+
+            wait = self.interval * random.uniform(0.9, 1.1)
+            self.planned_wait = max(wait, self._quota_wait(now))
+            return self.planned_wait
+
+    def _quota_wait(self, now):
+        if not self.quota_per_minute or len(self.calls) < self.quota_per_minute:
+            return 0.0
+        return 60 - (now - self.calls[len(self.calls) - self.quota_per_minute])
+
+    def metrics(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            return {
+                "interval_seconds": self.interval,
+                "next_wait_seconds": self.planned_wait,
+                "consecutive_errors": self.consecutive_errors,
+                "api_calls_last_minute": len(self.calls),
+                "quota_per_minute": self.quota_per_minute,
+                "poll_lag_seconds": self.last_lag_seconds,
+                "seconds_since_new_rows": now - self.last_new_rows_at if self.last_new_rows_at else None,
+            }
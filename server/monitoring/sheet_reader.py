@@ -0,0 +1,130 @@
+import threading
+from googleapiclient.discovery import build
+from google.oauth2.service_account import Credentials
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+class SheetReader:
+    """
+    Reads a Google Sheet incrementally with a single authorized client.
+
+    The header row is read once; afterwards only rows below the last known row are fetched,
+    in pages of `page_size` rows requested `pages_per_call` at a time through values().batchGet.
+    Ranges are clipped to the sheet's grid (gridProperties.rowCount), since the API rejects ranges
+    that start past the last row. Rows are returned as (sheet_row_number, {header: value}) pairs.
+    """
+
+    def __init__(self, spreadsheet_id, sheet_name="Sheet1", credentials_file="credentials.json",
+                 last_column="Z", page_size=500, pages_per_call=4):
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.credentials_file = credentials_file
+        self.last_column = last_column
+        self.page_size = page_size
+        self.pages_per_call = pages_per_call
+        self.headers = None
+        self.last_row = 1
+        self.row_count = None
+        self.api_calls = 0
+        self._service = None
+        self._lock = threading.Lock()
+
+    def _spreadsheets(self):
+        with self._lock:
+            if self._service is None:
+                creds = Credentials.from_service_account_file(self.credentials_file, scopes=SCOPES)
+                self._service = build("sheets", "v4", credentials=creds, cache_discovery=False)
+        return self._service.spreadsheets()
+
+    def _values(self):
+        return self._spreadsheets().values()
+
+    def _grid_rows(self, refresh=False):
+        """Number of rows in the sheet's grid (not just the filled ones); cached until refresh."""
+        if self.row_count is None or refresh:
+            result = self._spreadsheets().get(
+                spreadsheetId=self.spreadsheet_id, fields="sheets.properties(title,gridProperties.rowCount)"
+            ).execute()
+            self.api_calls += 1
+            for sheet in result.get("sheets", []):
+                properties = sheet.get("properties", {})
+                if properties.get("title") == self.sheet_name:
+                    self.row_count = properties.get("gridProperties", {}).get("rowCount", 0)
+                    break
+            else:
+                raise ValueError(f"Sheet {self.sheet_name!r} not found in spreadsheet {self.spreadsheet_id}")
+        return self.row_count
+
+    def _load_headers(self):
+        if self.headers is None:
+            result = self._values().get(
+                spreadsheetId=self.spreadsheet_id, range=f"{self.sheet_name}!1:1"
+            ).execute()
+            self.api_calls += 1
+            rows = result.get("values", [])
+            self.headers = rows[0] if rows else []
+        return self.headers
+
+    def _to_dict(self, row):
+        extended_row = row + [''] * (len(self.headers) - len(row))
+        return dict(zip(self.headers, extended_row))
+
+    def _read_from(self, start_row):
+        """Reads every row from start_row to the end of the sheet, page by page."""
+        headers = self._load_headers()
+        if not headers:
+            return [], start_row - 1
+
+        content = []
+        last_row = start_row - 1
+        next_row = start_row
+        row_count = self._grid_rows()
+
+        while True:
+            if next_row > row_count:
+                # The rows read so far filled the grid; it may have grown since it was last measured
+                row_count = self._grid_rows(refresh=True)
+                if next_row > row_count:
+                    return content, last_row
+
+            ranges = []
+            for page in range(self.pages_per_call):
+                first = next_row + page * self.page_size
+                if first > row_count:
+                    break
+                last = min(first + self.page_size - 1, row_count)
+                ranges.append((first, last, f"{self.sheet_name}!A{first}:{self.last_column}{last}"))
+
+            result = self._values().batchGet(
+                spreadsheetId=self.spreadsheet_id, ranges=[name for _, _, name in ranges]
+            ).execute()
+            self.api_calls += 1
+
+            reached_end = False
+            for (first, last, _), value_range in zip(ranges, result.get("valueRanges", [])):
+                rows = value_range.get("values", [])
+                for offset, row in enumerate(rows):
+                    if not row or all(cell == '' for cell in row):
+                        continue
+                    content.append((first + offset, self._to_dict(row)))
+                    last_row = first + offset
+                if len(rows) < last - first + 1:
+                    reached_end = True
+                    break
+
+            if reached_end:
+                return content, last_row
+            next_row = ranges[-1][1] + 1
+
+    def read_all(self):
+        """Full read of every data row; resets the tail position to the real end of the sheet."""
+        self._grid_rows(refresh=True)
+        content, last_row = self._read_from(2)
+        self.last_row = max(last_row, 1)
+        return content
+
+    def read_new_rows(self):
+        """Reads only rows after the last known row."""
+        content, last_row = self._read_from(self.last_row + 1)
+        self.last_row = max(self.last_row, last_row)
+        return content
@@ -0,0 +1,35 @@
+from abc import ABC, abstractmethod
+
+class IngestionSource(ABC):
+    """
+    An email intake feeding the processing pipeline.
+
+    A source calls emit(changes) with a list of change dicts shaped like sheet rows
+    (EmailID, Subject, Body, Attachment, Date, Time); the monitor queues them for the workers.
+    """
+
+    name = "source"
+
+    @abstractmethod
+    def start(self, emit):
+        """Begins delivering changes through emit; must not block."""
+
+    def stop(self):
+        pass
+
+_sources = {}
+
+def register_source(name, factory):
+    """Registers a factory returning an IngestionSource, or None when the source is not configured."""
+    _sources[name] = factory
+
+def start_sources(emit):
+    started = []
+    for name, factory in _sources.items():
+        source = factory()
+        if source is None:
+            continue
+        source.start(emit)
+        print(f"Started ingestion source: {name}")
+        started.append(source)
+    return started
@@ -0,0 +1,62 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config.llm_gateway import llm_call_count, reset_llm_call_count, add_llm_call_count
+
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "12"))
+
+executor = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculative")
+speculation_stats = {"started": 0, "used": 0, "cancelled": 0, "discarded": 0, "wasted_llm_calls": 0}
+speculation_stats_lock = threading.Lock()
+
+def _count(key, amount=1):
+    with speculation_stats_lock:
+        speculation_stats[key] += amount
+
+def _run(fn, args):
+    reset_llm_call_count()
+    try:
+        return fn(*args), None, llm_call_count()
+    except Exception as e:
+        return None, e, llm_call_count()
+
+class Speculation:
+    """
+    Independent pipeline steps for one email, started together before it is known which are needed.
+
+    result(name) waits for a step and merges its LLM calls into the caller's thread count; steps
+    never asked for are cancelled if they have not started, otherwise their results are discarded.
+    """
+
+    def __init__(self):
+        self.futures = {}
+
+    def start(self, name, fn, *args):
+        self.futures[name] = executor.submit(_run, fn, args)
+        _count("started")
+
+    def run(self, name, fn, *args):
+        """Result of the speculative step `name`, or fn(*args) run inline when it was not started."""
+        future = self.futures.pop(name, None)
+        if future is None:
+            return fn(*args)
+
+        value, error, calls = future.result()
+        add_llm_call_count(calls)
+        _count("used")
+        if error:
+            raise error
+        return value
+
+    def discard(self):
+        for future in self.futures.values():
+            if future.cancel():
+                _count("cancelled")
+            else:
+                _count("discarded")
+                future.add_done_callback(lambda done: _count("wasted_llm_calls", done.result()[2]))
+        self.futures = {}
+
+def get_speculation_stats():
+    with speculation_stats_lock:
+        return dict(speculation_stats)
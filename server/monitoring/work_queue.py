@@ -0,0 +1,179 @@
+import json
+import os
+import random
+import time
+from config.local_store import get_connection, ensure_schema
+
+MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("QUEUE_RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = float(os.getenv("QUEUE_RETRY_MAX_SECONDS", "3600"))
+LEASE_SECONDS = float(os.getenv("QUEUE_LEASE_SECONDS", "600"))
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS work_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        queue TEXT NOT NULL,
+        sender TEXT,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL,
+        leased_until REAL,
+        lease_owner TEXT,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_work_items_ready ON work_items (queue, status, available_at)",
+    "CREATE INDEX IF NOT EXISTS idx_work_items_sender ON work_items (queue, sender, id)",
+]
+
+def retry_delay(attempts):
+    """Exponential backoff with full jitter for the given number of failed attempts."""
+    ceiling = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    return random.uniform(ceiling / 2, ceiling)
+
+class WorkQueue:
+    """
+    Durable SQLite work queue with leases, retry backoff and a dead-letter list.
+
+    Items that share a sender are leased strictly in enqueue order: an item is only handed out
+    once every earlier item from the same sender is done or dead-lettered.
+    """
+
+    def __init__(self, name="changes", path=None, max_attempts=MAX_ATTEMPTS, lease_seconds=LEASE_SECONDS):
+        self.name = name
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        ensure_schema(self._conn(), SCHEMA)
+
+    def _conn(self):
+        return get_connection(self.path)
+
+    def enqueue_many(self, items, sender_of=None):
+        """Adds payloads to the queue in order; sender_of(item) returns the ordering key or None."""
+        if not items:
+            return 0
+        now = time.time()
+        rows = [
+            (self.name, sender_of(item) if sender_of else None, json.dumps(item, default=str), now, now, now)
+            for item in items
+        ]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO work_items (queue, sender, payload, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def lease(self, owner):
+        """Leases the next ready item; returns (item_id, payload, attempts) or None. Expired leases are reclaimed."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """
+                SELECT id, payload, attempts FROM work_items AS w
+                WHERE w.queue = ?
+                  AND ((w.status = 'pending' AND w.available_at <= ?)
+                       OR (w.status = 'leased' AND w.leased_until < ?))
+                  AND NOT EXISTS (
+                      SELECT 1 FROM work_items AS e
+                      WHERE e.queue = w.queue AND e.sender = w.sender AND e.id < w.id
+                        AND e.status IN ('pending', 'leased')
+                  )
+                ORDER BY w.id
+                LIMIT 1
+                """,
+                (self.name, now, now),
+            ).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE work_items SET status = 'leased', attempts = attempts + 1, leased_until = ?, "
+                "lease_owner = ?, updated_at = ? WHERE id = ?",
+                (now + self.lease_seconds, owner, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return row["id"], json.loads(row["payload"]), row["attempts"] + 1
+
+    def ack(self, item_id):
+        self._conn().execute("DELETE FROM work_items WHERE id = ?", (item_id,))
+
+    def fail(self, item_id, error):
+        """Schedules a retry with backoff, or dead-letters the item once it is out of attempts."""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT attempts FROM work_items WHERE id = ?", (item_id,)).fetchone()
+        if row is None:
+            return None
+
+        if row["attempts"] >= self.max_attempts:
+            conn.execute(
+                "UPDATE work_items SET status = 'dead', leased_until = NULL, lease_owner = NULL, "
+                "last_error = ?, updated_at = ? WHERE id = ?",
+                (str(error), now, item_id),
+            )
+            return "dead"
+
+        conn.execute(
+            "UPDATE work_items SET status = 'pending', available_at = ?, leased_until = NULL, "
+            "lease_owner = NULL, last_error = ?, updated_at = ? WHERE id = ?",
+            (now + retry_delay(row["attempts"]), str(error), now, item_id),
+        )
+        return "retry"
+
+    def dead_letters(self, limit=50):
+        rows = self._conn().execute(
+            "SELECT id, sender, payload, attempts, last_error, updated_at FROM work_items "
+            "WHERE queue = ? AND status = 'dead' ORDER BY id LIMIT ?",
+            (self.name, limit),
+        ).fetchall()
+        return [{**dict(row), "payload": json.loads(row["payload"])} for row in rows]
+
+    def requeue_dead(self, item_id):
+        """Moves a dead-lettered item back to the queue with a fresh attempt budget."""
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE work_items SET status = 'pending', attempts = 0, available_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'dead'",
+            (now, now, item_id),
+        )
+        return cursor.rowcount > 0
+
+    def stats(self):
+        conn = self._conn()
+        counts = {
+            row["status"]: row["count"]
+            for row in conn.execute(
+                "SELECT status, COUNT(*) AS count FROM work_items WHERE queue = ? GROUP BY status", (self.name,)
+            )
+        }
+        oldest = conn.execute(
+            "SELECT MIN(created_at) AS oldest FROM work_items WHERE queue = ? AND status IN ('pending', 'leased')",
+            (self.name,),
+        ).fetchone()["oldest"]
+        return {
+            "pending": counts.get("pending", 0),
+            "leased": counts.get("leased", 0),
+            "dead": counts.get("dead", 0),
+            "oldest_age_seconds": time.time() - oldest if oldest else 0.0,
+        }
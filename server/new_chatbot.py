@@ -12,7 +12,7 @@ from langchain_google_vertexai import VertexAIEmbeddings
 import pandas as pd
 from bson.objectid import ObjectId
 import json
-from config.gemini_config import gemini_model
+from config.llm_gateway import gemini_generate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from config.dbConfig import db
 from werkzeug.exceptions import HTTPException
@@ -318,11 +318,10 @@ Use the *provided context and chat history* to answer the query accurately.
 *Answer:*
 """
     
-    response = gemini_model.generate_content(prompt)
-    response_text = response.text.strip() if hasattr(response, "text") else ""
+    response_text = gemini_generate(prompt)
     
-    if response and hasattr(response, "text"):
-        return {"response": response_text}
+    if response_text is not None:
+        return {"response": response_text.strip()}
     else:
         return {"error": "Invalid response format from Google Vertex AI"}
     
@@ -1,33 +1,47 @@
 # ordder file
-from ai21 import AI21Client
-from ai21.models.chat import UserMessage
 import json
 from config.dbConfig import db
-from datetime import datetime, timedelta
-import os
+from datetime import timedelta
 from dotenv import load_dotenv
 from email_config.send_emails import send_acknowledgment, send_order_update_confirmation, send_order_issue_email
-from config.gemini_config import gemini_model
+from config.llm_gateway import gemini_generate
 import re
+import threading
+import time as time_module
+from bson import ObjectId
 from pymongo import DESCENDING
 from error_handle import handle_exception
+from order_validation import validate_order_details, validate_customer_details, parse_quantity
+from product_matcher import product_index, PRODUCT_MATCH_THRESHOLD
+from email_extraction import extract_email
+from customer_store import get_customer, get_or_create_customer, update_customer_order, update_customer_order_status, has_customer_order
+from order_keys import order_placed_at, order_fingerprint
+from inventory_reservation import reserve_stock, release_stock, requested_quantities, current_shortfalls, inventory_snapshot, order_quantities, adjust_reservation, HOLDING_STATUSES
 
 load_dotenv()
-API_KEY = os.getenv("AI21KEY")
 
-client = AI21Client(api_key=API_KEY)
 order_collection = db['orders']
-inventory_collection = db['inventory']
-customers_collection = db['customers']
+
+DUPLICATE_WINDOW = timedelta(hours=24)
+
+commit_stats = {}
+commit_stats_lock = threading.Lock()
+
 
 def fetch_inventory_items():
-    inventory_items = inventory_collection.find({}, {"_id": 0, "name": 1})
-    return {item["name"] for item in inventory_items}
+    return product_index.names()
 
-def correct_product_names(order_details, inventory_items):
+def resolve_product_names_ai(product_names, inventory_items):
+    """
+    Asks Gemini to map ordered names the local matcher was unsure about to inventory names.
+    Only a shortlist of likely candidates is sent; returns one inventory name or None per input.
+    """
     try:
-        inventory_list = "\n".join(inventory_items)
-        orders_list = "\n".join([f"- {order['product']}" for order in order_details])
+        shortlist = []
+        for name in product_names:
+            shortlist.extend(candidate for candidate, _ in product_index.candidates(name, limit=5))
+        inventory_list = "\n".join(sorted(set(shortlist)) or sorted(inventory_items))
+        orders_list = "\n".join([f"{i}. {name}" for i, name in enumerate(product_names, start=1)])
         
         prompt = f"""
         Here is our inventory list:
@@ -37,28 +51,44 @@ def correct_product_names(order_details, inventory_items):
         {orders_list}
 
         For each ordered product, find the closest matching product from our inventory.
-        Return only the corrected product names, one per line.
-        """
 
-        response = gemini_model.generate_content(prompt)
-        ai_response = response.text.strip()
+        **Expected JSON Output (Strict Format, No Explanation):**
+        {{"1": "Exact inventory product name or null if nothing matches"}}
+        """
 
-        corrected_product_names = [name.lstrip("- ").strip() for name in ai_response.split("\n") if name.strip()]
+        ai_response = gemini_generate(
+            prompt, cache="correct_product_names", generation_config={"response_mime_type": "application/json"}
+        ).strip()
+        matches = json.loads(re.sub(r"```json|```", "", ai_response).strip())
 
-        corrected_orders = []
-        for i, order in enumerate(order_details):
-            if i < len(corrected_product_names):
-                corrected_orders.append({
-                    "product": corrected_product_names[i],
-                    "quantity": order["quantity"]
-                })
-            else:
-                corrected_orders.append(order)
+        return [
+            matches.get(str(i)) if matches.get(str(i)) in inventory_items else None
+            for i in range(1, len(product_names) + 1)
+        ]
 
     except Exception as e:
         handle_exception(e)
         print(f"Error correcting product names: {e}")
-        corrected_orders = order_details
+        return [None] * len(product_names)
+
+def correct_product_names(order_details, inventory_items):
+    corrected_orders = []
+    low_confidence = []
+
+    for i, order in enumerate(order_details):
+        match, score = product_index.match(order["product"])
+        if match and score >= PRODUCT_MATCH_THRESHOLD:
+            corrected_orders.append({"product": match, "quantity": order["quantity"]})
+        else:
+            corrected_orders.append(order)
+            low_confidence.append(i)
+
+    if low_confidence:
+        ordered_names = [order_details[i]["product"] for i in low_confidence]
+        for i, name in zip(low_confidence, resolve_product_names_ai(ordered_names, inventory_items)):
+            if name:
+                product_index.learn_alias(order_details[i]["product"], name)
+                corrected_orders[i] = {"product": name, "quantity": order_details[i]["quantity"]}
 
     print('Corrected Orders:', corrected_orders)
     return corrected_orders
@@ -72,6 +102,7 @@ def validate_order_details_ai(order_details):
     - Ensure that each item has a product name and quantity.
     - The price is not required.
     - If any required detail is missing or unclear, list it as an error.
+    - For each item, give its quantity as a whole number (e.g. "a dozen" is 12), or null if it cannot be determined.
 
     **Order Details:**
     {json.dumps(order_details, indent=2)}
@@ -79,18 +110,22 @@ def validate_order_details_ai(order_details):
     **Expected JSON Output (Strict Format, No Explanation):**
     {{
         "valid": true/false,
-        "errors": ["Missing quantity for product X"]
+        "errors": ["Missing quantity for product X"],
+        "quantities": [12, null]
     }}
     """
 
     try:
-        response = gemini_model.generate_content(prompt)
-        ai_response = response.text.strip()
+        ai_response = gemini_generate(prompt, cache="validate_order_details").strip()
 
         clean_response = re.sub(r"```json|```", "", ai_response).strip()
 
         try:
             validation_result = json.loads(clean_response)
+            quantities = validation_result.get("quantities") or []
+            for item, quantity in zip(order_details, quantities):
+                if isinstance(quantity, int) and not isinstance(quantity, bool) and quantity > 0:
+                    item["quantity"] = quantity
             return validation_result.get("valid", False), validation_result.get("errors", [])
         except json.JSONDecodeError as e:
             return False, [f"Invalid AI response format. JSON Parsing Error: {str(e)}"]
@@ -99,59 +134,65 @@ def validate_order_details_ai(order_details):
         return False, [f"System error while validating order: {str(e)}"]
 
 def extract_order_details_ai(email_text):
-    messages = [
-        UserMessage(
-            content=f"""
-            You are an AI assistant extracting order details from an email.
-            Extract and return only in JSON format:
-
-            **Email:**
-            "{email_text}"
-
-            **Expected JSON Output:**
-            {{
-                "orders": [
-                    {{"product": "Product Name", "quantity": Number}}
-                ]
-            }}
-            """
-        )
-    ]
-    try:
-        response = client.chat.completions.create(
-            model="jamba-1.5-large",
-            messages=messages,
-            top_p=1.0
-        )
-        result = response.model_dump()
-        
-        if "choices" in result and result["choices"]:
-            content_str = result["choices"][0]["message"]["content"]
-            extracted_orders = json.loads(content_str)
-            return extracted_orders.get("orders", [])
-        else:
-            print("Error: No choices found in API response.")
-            return []
-    except Exception as e:
-        handle_exception(e)
-        print(f"Error extracting order details: {e}")
-        return []
+    """Order lines from an email, via the unified extraction stage."""
+    extraction = extract_email(email_text, None)
+    return extraction["orders"] if extraction else []
+
+def check_availability(order_details):
+    """
+    Resolves every line item with one $in query and returns the shortfalls as
+    [{"product", "requested", "available"}]; an empty list means the order can be fulfilled.
+    Repeated lines for the same product are summed before comparing.
+    """
+    return current_shortfalls(requested_quantities(order_details))
 
 def check_inventory(order_details):
-    for order in order_details:
-        product = order["product"]
-        quantity = order["quantity"]
+    return not check_availability(order_details)
 
-        inventory_item = inventory_collection.find_one({"name": product})
-        if not inventory_item or inventory_item["quantity"] < quantity:
-            return False
+def format_shortfalls(shortfalls):
+    lines = [
+        f"- {item['product']}: {item['requested']} requested, {item['available']} in stock"
+        for item in shortfalls
+    ]
+    return "The following items are currently out of stock, which may delay your order:\n" + "\n".join(lines)
+
+def record_commit_timings(order_id, timings):
+    with commit_stats_lock:
+        for stage, seconds in timings.items():
+            stats = commit_stats.setdefault(stage, {"count": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+    stages = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+    print(f"Order {order_id} commit stages: {stages} (total {sum(timings.values()) * 1000:.1f}ms)")
+
+def get_commit_stats():
+    """Average latency per order commit stage, in milliseconds."""
+    with commit_stats_lock:
+        return {
+            stage: {"count": stats["count"], "avg_ms": stats["seconds"] / stats["count"] * 1000}
+            for stage, stats in commit_stats.items()
+        }
 
-    return True
+def price_products(lines, snapshot=None):
+    """Stored order lines for (name, quantity) pairs, with unit prices from the inventory, and the order total."""
+    snapshot = inventory_snapshot({name for name, _ in lines}) if snapshot is None else snapshot
+    products = [
+        {"name": name, "quantity": quantity, "price": snapshot.get(name, {}).get("price", 0)}
+        for name, quantity in lines
+    ]
+    total = sum((item["price"] or 0) * item["quantity"] for item in products)
+    return products, total
 
 def get_customer_from_db(email):
-    return customers_collection.find_one({"email": email})
+    return get_customer(email)
 
-def add_orders_to_collection(email, date, time, customer_details, order_details):
+def add_orders_to_collection(email, date, time, customer_details, order_details, timings=None):
+    """
+    Validates, de-duplicates, reserves stock for and inserts one order; returns the inserted
+    order document (products carry their unit price, plus the order total) or None.
+    Stage latencies are written to `timings` when a dict is passed.
+    """
+    timings = {} if timings is None else timings
     try:
         inventory_items = fetch_inventory_items()
         corrected_orders = correct_product_names(order_details, inventory_items)
@@ -159,101 +200,105 @@ def add_orders_to_collection(email, date, time, customer_details, order_details)
             order["product"] for order in corrected_orders if order["product"] not in inventory_items
         ]
 
-    if unknown_products:
-        print('Unknown products found. Order not added.')
-        return None
+        if unknown_products:
+            print('Unknown products found. Order not added.')
+            return None
     
-    order_datetime = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M:%S")
-    twenty_four_hours_ago = order_datetime - timedelta(hours=24)
-    yesterday_date = twenty_four_hours_ago.strftime("%Y-%m-%d")
-    yesterday_time = twenty_four_hours_ago.strftime("%H:%M:%S")
-
-    existing_order = order_collection.find_one({
-    "email": email,
-    "$or": [
-        {"date": date, "time": {"$gte": yesterday_time, "$lte": time}} if date == yesterday_date else {"date": date},
-        {"date": yesterday_date, "time": {"$gte": yesterday_time}} if date != yesterday_date else {}
-    ],
-    "products": {
-        "$size": len(corrected_orders),
-        "$all": [
-            {"$elemMatch": {
-                "name": item["product"],
-                "quantity": item["quantity"]
-            }} for item in corrected_orders
-        ]}
-    })
-
-    if existing_order:
-        print("Duplicate order detected. Order not added.")
-        send_order_issue_email(email, [" A duplicate order was detected within the last few minutes. Please confirm if this was an accidental duplicate order if you intended to reorder it."])
-        return None
+        placed_at = order_placed_at(date, time)
+        fingerprint = order_fingerprint(email, corrected_orders)
+
+        started = time_module.perf_counter()
+        existing_order = order_collection.find_one(
+            {"fingerprint": fingerprint, "placed_at": {"$gte": placed_at - DUPLICATE_WINDOW, "$lte": placed_at}}
+        )
+        timings["duplicate_check"] = time_module.perf_counter() - started
+
+        if existing_order and existing_order["placed_at"] == placed_at and not has_customer_order(existing_order["_id"]):
+            # A retried queue item (same row, so same timestamp) whose earlier attempt inserted the
+            # order but failed before the customer writes: reuse the order so the caller finishes them
+            print(f"Resuming the commit of order {existing_order['_id']}.")
+            return existing_order
+
+        if existing_order:
+            print("Duplicate order detected. Order not added.")
+            send_order_issue_email(email, [" A duplicate order was detected within the last few minutes. Please confirm if this was an accidental duplicate order if you intended to reorder it."])
+            return None
 
+        reserved = None
+        order_id = ObjectId()
+        order_link = f"http://localhost:3000/track-order/{order_id}"
         try:
-            can_fulfill = check_inventory(order_details=corrected_orders)
-            if not can_fulfill:
+            started = time_module.perf_counter()
+            requested = requested_quantities(corrected_orders)
+            snapshot = inventory_snapshot(requested)
+            shortfalls = current_shortfalls(requested, snapshot)
+            timings["availability"] = time_module.perf_counter() - started
+
+            products, total = price_products([(item["product"], item["quantity"]) for item in corrected_orders], snapshot)
+            if not shortfalls:
+                started = time_module.perf_counter()
+                reserved, shortfalls = reserve_stock(corrected_orders)
+                timings["reserve"] = time_module.perf_counter() - started
+            if shortfalls:
                 formatted_entry = {
+                    "_id": order_id,
                     "name": customer_details['name'],
                     "phone": customer_details['phone'],
                     "email": email,
                     "date": date,
                     "time": time,
-                    "products": [{"name": item["product"], "quantity": item["quantity"]} for item in corrected_orders],
+                    "placed_at": placed_at,
+                    "fingerprint": fingerprint,
+                    "products": products,
+                    "total": total,
                     "status": "pending inventory",
-                    "orderLink": ""
+                    "shortfalls": shortfalls,
+                    "orderLink": order_link
                 }
                 
-                result = order_collection.insert_one(formatted_entry)
-                order_id = str(result.inserted_id)
-                
-                order_collection.update_one(
-                    {"_id": result.inserted_id},
-                    {"$set": {"orderLink": f"http://localhost:3000/track-order/{order_id}"}}
-                )
+                started = time_module.perf_counter()
+                order_collection.insert_one(formatted_entry)
+                timings["insert"] = time_module.perf_counter() - started
                 
                 print("Order added with pending inventory status.")
-                send_acknowledgment(formatted_entry, message="Some items are currently out of stock, which may delay your order. Would you still like to proceed or cancel it?", customer_subject="Query Mail")
-                return order_id
+                send_acknowledgment(formatted_entry, message=f"{format_shortfalls(shortfalls)}\n\nWould you still like to proceed or cancel it?", customer_subject="Query Mail")
+                return formatted_entry
         except Exception as e:
             print(f"Error checking inventory or adding pending order: {e}")
             handle_exception(e)
             return None
 
+        result = None
         try:
             formatted_entry = {
+                "_id": order_id,
                 "name": customer_details['name'],
                 "phone": customer_details['phone'],
                 "email": email,
                 "date": date,
                 "time": time,
-                "products": [{"name": item["product"], "quantity": item["quantity"]} for item in corrected_orders],
+                "placed_at": placed_at,
+                "fingerprint": fingerprint,
+                "products": products,
+                "total": total,
                 "status": "pending fulfillment",
-                "orderLink": ""
+                "orderLink": order_link
             }
             
+            started = time_module.perf_counter()
             result = order_collection.insert_one(formatted_entry)
-            order_id = str(result.inserted_id)
-            
-            order_collection.update_one(
-                {"_id": result.inserted_id},
-                {"$set": {"orderLink": f"http://localhost:3000/track-order/{order_id}"}}
-            )
-            
-            for item in corrected_orders:
-                inventory_collection.update_one(
-                    {"item": item["product"]},
-                    {"$inc": {"quantity": -item["quantity"]}}
-                )
+            timings["insert"] = time_module.perf_counter() - started
             
             print('Order added and inventory updated.')
             send_acknowledgment(formatted_entry)
-            return order_id
+            return formatted_entry
         except Exception as e:
             print(f"Error adding order or updating inventory: {e}")
             handle_exception(e)
             # If we've gotten this far but failed, try to rollback any inventory changes
             try:
-                if 'result' in locals() and result and result.inserted_id:
+                release_stock(reserved)
+                if result and result.inserted_id:
                     order_collection.delete_one({"_id": result.inserted_id})
                     print("Rolled back order insertion due to error.")
             except Exception as rollback_error:
@@ -295,8 +340,7 @@ def validate_customer_details_ai(email, customer_details):
         }}
         """
 
-        response = gemini_model.generate_content(prompt)
-        ai_response = response.text.strip()
+        ai_response = gemini_generate(prompt, cache="validate_customer_details").strip()
 
         clean_response = re.sub(r"``````", "", ai_response).strip()
 
@@ -321,19 +365,17 @@ def process_order_details(email, date, time, order_details):
         send_order_issue_email(email, ["No order details were found in your email. Please send a valid order."])
         return
 
-    is_valid, errors = validate_order_details_ai(orders)
+    is_valid, errors = validate_order_details(orders, llm_fallback=validate_order_details_ai)
     if not is_valid:
-        # print("Order details are invalid. Sending issue email.")
-        # send_order_issue_email(email, errors)
+        print("Order details are invalid. Sending issue email.")
+        send_order_issue_email(email, errors)
         return
 
     existing_customer = get_customer_from_db(email)
-    customer_id = None
 
     # Check if customer exists in database
     if not existing_customer:
-        # Validate customer details using AI
-        is_valid, missing_fields, customer_details = validate_customer_details_ai(email, customer_details)
+        is_valid, missing_fields, customer_details = validate_customer_details(email, customer_details)
         
         if not is_valid:
             # print(f"Incomplete customer details: {missing_fields}")
@@ -344,21 +386,8 @@ def process_order_details(email, date, time, order_details):
             send_order_issue_email(email, error_message)
             return
         
-        # Create new customer if all details are valid
-        new_customer = {
-            "name": customer_details["name"],
-            "email": customer_details["email"],
-            "phone": customer_details["phone"],
-            "address": customer_details["address"],
-            "past_orders": [],
-            "created_at": datetime.utcnow()
-        }
-        result = customers_collection.insert_one(new_customer)
-        customer_id = result.inserted_id
-        print("New customer created successfully.")
+        # New customers are created together with their first order below
     else:
-        customer_id = existing_customer["_id"]
-        
         # If customer exists but some details are missing in the current order
         if not customer_details:
             customer_details = {
@@ -369,7 +398,7 @@ def process_order_details(email, date, time, order_details):
             }
         else:
             # Validate if the provided customer details are complete
-            is_valid, missing_fields, customer_details = validate_customer_details_ai(email, customer_details)
+            is_valid, missing_fields, customer_details = validate_customer_details(email, customer_details)
             
             if not is_valid:
                 # Fill in missing fields from existing customer record  
@@ -378,7 +407,7 @@ def process_order_details(email, date, time, order_details):
                         customer_details[field] = existing_customer[field]
                 
                 # Check if any fields are still missing
-                is_valid, still_missing, _ = validate_customer_details_ai(email, customer_details)
+                is_valid, still_missing, _ = validate_customer_details(email, customer_details)
                 if not is_valid:
                     print(f"Still missing customer details: {still_missing}")
                     error_message = [
@@ -388,22 +417,28 @@ def process_order_details(email, date, time, order_details):
                     send_order_issue_email(email, error_message)
                     return
 
-    order_id = add_orders_to_collection(email, date, time, customer_details, orders)
+    timings = {}
+    order = add_orders_to_collection(email, date, time, customer_details, orders, timings=timings)
     
-    if order_id:
-        # Update to include more order details in past_orders
+    if order:
+        order_id = str(order["_id"])
+        # Compact summary for the customer's order history and rolling aggregates
         order_summary = {
             "order_id": order_id,
             "date": date,
             "time": time,
-            "products": orders,
-            "status": "pending fulfillment"
+            "placed_at": order["placed_at"],
+            "products": order["products"],
+            "total": order["total"],
+            "status": order["status"]
         }
         
-        customers_collection.update_one(
-            {"_id": customer_id},
-            {"$push": {"past_orders": order_summary}}
-        )
+        started = time_module.perf_counter()
+        get_or_create_customer(email, customer_details, order_summary)
+        if not existing_customer:
+            print("New customer created successfully.")
+        timings["customer"] = time_module.perf_counter() - started
+        record_commit_timings(order_id, timings)
         print(f"Order {order_id} processed successfully.")
     else:
         print("Order processing failed.")
@@ -412,12 +447,12 @@ def process_order_change(email, date, time, order_details):
     print('Processing order change...')
     try:
         
-        latest_order = order_collection.find_one({"email": email}, sort=[("date", DESCENDING), ("time", DESCENDING)])
+        latest_order = order_collection.find_one({"email": email}, sort=[("placed_at", DESCENDING)])
         if not latest_order:
             process_order_details(email, date, time, order_details)
             return
 
-        if latest_order.get("status") not in ["pending fulfillment", "partially fulfilled"]:
+        if latest_order.get("status") not in HOLDING_STATUSES:
             process_order_details(email, date, time, order_details)
             return
         
@@ -429,11 +464,34 @@ def process_order_change(email, date, time, order_details):
         }
         
         updated_products = get_ai_order_updates(latest_order, order_details)
-        
+        lines = []
+        for item in updated_products:
+            quantity, _ = parse_quantity(item.get("quantity"))
+            if item.get("name") and quantity:
+                lines.append((item["name"], quantity))
+        products, total = price_products(lines)
+        previous_quantities = order_quantities(latest_order["products"])
+        shortfalls = adjust_reservation(previous_quantities, order_quantities(products))
+
+        if shortfalls:
+            # Same fallback as a new order: hold no stock and ask the customer how to proceed
+            release_stock(previous_quantities)
+            shortfalls = current_shortfalls(order_quantities(products))
+            order_collection.update_one(
+                {"_id": latest_order["_id"]},
+                {"$set": {"products": products, "total": total, "status": "pending inventory", "shortfalls": shortfalls}}
+            )
+            update_customer_order(latest_order["_id"], products, total)
+            update_customer_order_status(latest_order["_id"], "pending inventory")
+            updated_order = order_collection.find_one({"_id": latest_order["_id"]})
+            send_acknowledgment(updated_order, message=f"{format_shortfalls(shortfalls)}\n\nWould you still like to proceed or cancel it?", customer_subject="Query Mail")
+            return
+
         order_collection.update_one(
             {"_id": latest_order["_id"]},
-            {"$set": {"products": updated_products}}
+            {"$set": {"products": products, "total": total}}
         )
+        update_customer_order(latest_order["_id"], products, total)
         
         updated_order = order_collection.find_one({"_id": latest_order["_id"]})
         send_order_update_confirmation(email, latest_order=updated_order, previous_order=previous_order)
@@ -476,8 +534,7 @@ def get_ai_order_updates(previous_order, new_order_details):
         ]
         """
         
-        response = gemini_model.generate_content(prompt)
-        ai_response = response.text.strip()
+        ai_response = gemini_generate(prompt).strip()
         
         clean_response = re.sub(r"``````", "", ai_response).strip()
         
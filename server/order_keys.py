@@ -0,0 +1,37 @@
+import hashlib
+import json
+import re
+from datetime import datetime
+from order_validation import parse_quantity
+
+def parse_placed_at(date, time):
+    """The order's date/time strings as a datetime, or None if they cannot be parsed."""
+    try:
+        return datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+def order_placed_at(date, time):
+    """
+    Like parse_placed_at, but falls back to the current time. placed_at is naive local time,
+    the clock the monitor stamps rows with and analytics compares against.
+    """
+    placed_at = parse_placed_at(date, time)
+    if placed_at is None:
+        print(f"Unparseable order date/time {date!r} {time!r}, using the current time")
+        return datetime.now()
+    return placed_at
+
+def order_fingerprint(email, order_details):
+    """
+    Hash of the sender address and the sorted (product, total quantity) pairs of an order.
+    Quantities are read with parse_quantity, so "2" and 2 match; unreadable ones count as 0.
+    """
+    match = re.search(r'<([^<>]+)>', email or "")
+    sender = (match.group(1) if match else email or "").strip().lower()
+    requested = {}
+    for order in order_details:
+        quantity, _ = parse_quantity(order["quantity"])
+        requested[order["product"]] = requested.get(order["product"], 0) + (quantity or 0)
+    payload = json.dumps([sender, sorted(requested.items())], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,148 @@
+import os
+import re
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_FALLBACK_ENABLED = os.getenv("ORDER_VALIDATION_LLM_FALLBACK", "true").lower() in ("1", "true", "yes")
+REQUIRED_CUSTOMER_FIELDS = ["name", "email", "phone", "address"]
+
+_INTEGER = re.compile(r"^\s*\+?(\d+)(?:\.0+)?\s*$")
+
+def _is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def parse_quantity(value):
+    """Returns (quantity, ambiguous). quantity is a positive int or None; ambiguous marks free text like "two boxes"."""
+    if isinstance(value, bool):
+        return None, False
+    if isinstance(value, int):
+        return (value, False) if value > 0 else (None, False)
+    if isinstance(value, float):
+        return (int(value), False) if value > 0 and value.is_integer() else (None, False)
+    if isinstance(value, str):
+        match = _INTEGER.match(value)
+        if match:
+            quantity = int(match.group(1))
+            return (quantity, False) if quantity > 0 else (None, False)
+        return None, bool(re.search(r"[A-Za-z]", value))
+    return None, False
+
+def validate_order_details(order_details, llm_fallback=None):
+    """
+    Local replacement for validate_order_details_ai with the same (valid, errors) contract.
+
+    Every item needs a product name and a positive integer quantity; numeric strings are
+    normalized to ints in place. Items whose quantity is free text ("a dozen") are handed to
+    llm_fallback when one is given and ORDER_VALIDATION_LLM_FALLBACK is enabled; the fallback
+    may write integer quantities back into the items, and any item still without one is
+    reported as an unclear quantity so the customer is asked.
+    """
+    if not isinstance(order_details, list) or not order_details:
+        return False, ["No order items found"]
+
+    errors = []
+    ambiguous = []
+    for position, item in enumerate(order_details, start=1):
+        if not isinstance(item, dict):
+            errors.append(f"Item {position} is not a valid order line")
+            continue
+
+        product = item.get("product")
+        label = product.strip() if isinstance(product, str) and product.strip() else f"item {position}"
+        if _is_blank(product) or not isinstance(product, str):
+            errors.append(f"Missing product name for item {position}")
+
+        if _is_blank(item.get("quantity")):
+            errors.append(f"Missing quantity for product {label}")
+            continue
+
+        quantity, is_ambiguous = parse_quantity(item["quantity"])
+        if quantity is not None:
+            item["quantity"] = quantity
+        elif is_ambiguous:
+            ambiguous.append(item)
+        else:
+            errors.append(f"Invalid quantity for product {label}: {item['quantity']}")
+
+    if ambiguous:
+        if llm_fallback and LLM_FALLBACK_ENABLED:
+            is_valid, llm_errors = llm_fallback(ambiguous)
+            if not is_valid:
+                errors.extend(llm_errors)
+        for item in ambiguous:
+            quantity, _ = parse_quantity(item["quantity"])
+            if quantity is None:
+                errors.append(f"Unclear quantity for product {item.get('product')}: {item['quantity']}")
+            else:
+                item["quantity"] = quantity
+
+    return not errors, errors
+
+def validate_customer_details(email, customer_details):
+    """
+    Local replacement for validate_customer_details_ai with the same
+    (is_valid, missing_fields, customer_details) contract.
+    """
+    if not customer_details:
+        customer_details = {}
+
+    missing_fields = [field for field in REQUIRED_CUSTOMER_FIELDS if _is_blank(customer_details.get(field))]
+    return not missing_fields, missing_fields, customer_details
+
+SAMPLE_ORDERS = [
+    [{"product": "Wireless Mouse", "quantity": 2}, {"product": "USB-C Cable", "quantity": "3"}],
+    [{"product": "Laptop Stand", "quantity": 1}],
+    [{"product": "", "quantity": 4}],
+    [{"product": "Monitor", "quantity": 0}],
+    [{"product": "Keyboard"}],
+]
+
+SAMPLE_CUSTOMERS = [
+    {"name": "Jane Doe", "email": "jane@example.com", "phone": "555-0100", "address": "1 Main St"},
+    {"name": "John Roe", "email": "john@example.com", "phone": "", "address": "2 Side St"},
+    None,
+]
+
+def benchmark(runs=10000, llm_runs=3):
+    """
+    Times the local validators against the Gemini validators on the sample orders/customers.
+    Run with LLM_CACHE_TTL_SECONDS=0 so the LLM path is not served from the prompt cache.
+    """
+    started = time.perf_counter()
+    for _ in range(runs):
+        for order in SAMPLE_ORDERS:
+            validate_order_details([dict(item) for item in order])
+        for customer in SAMPLE_CUSTOMERS:
+            validate_customer_details("customer@example.com", customer)
+    local_calls = runs * (len(SAMPLE_ORDERS) + len(SAMPLE_CUSTOMERS))
+    local_seconds = time.perf_counter() - started
+    print(f"Local validation: {local_seconds / local_calls * 1e6:.2f} µs per call over {local_calls} calls")
+
+    if not llm_runs:
+        return
+
+    from order_handling import validate_order_details_ai, validate_customer_details_ai
+
+    llm_seconds = 0.0
+    agreements = 0
+    for _ in range(llm_runs):
+        for order in SAMPLE_ORDERS:
+            local = validate_order_details([dict(item) for item in order])[0]
+            started = time.perf_counter()
+            remote = validate_order_details_ai(order)[0]
+            llm_seconds += time.perf_counter() - started
+            agreements += local == remote
+        for customer in SAMPLE_CUSTOMERS:
+            local = validate_customer_details("customer@example.com", customer)[0]
+            started = time.perf_counter()
+            remote = validate_customer_details_ai("customer@example.com", customer)[0]
+            llm_seconds += time.perf_counter() - started
+            agreements += local == remote
+    llm_calls = llm_runs * (len(SAMPLE_ORDERS) + len(SAMPLE_CUSTOMERS))
+    print(f"LLM validation: {llm_seconds / llm_calls * 1000:.1f} ms per call over {llm_calls} calls")
+    print(f"Agreement with the local validator: {agreements}/{llm_calls}")
+
+if __name__ == "__main__":
+    benchmark(llm_runs=int(os.getenv("BENCHMARK_LLM_RUNS", "3")))
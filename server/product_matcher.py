@@ -0,0 +1,162 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import Levenshtein
+from dotenv import load_dotenv
+from config.dbConfig import db
+
+load_dotenv()
+
+PRODUCT_MATCH_THRESHOLD = float(os.getenv("PRODUCT_MATCH_THRESHOLD", "0.85"))
+PRODUCT_INDEX_REFRESH_SECONDS = float(os.getenv("PRODUCT_INDEX_REFRESH_SECONDS", "60"))
+LEARNED_ALIAS_LIMIT = int(os.getenv("PRODUCT_LEARNED_ALIAS_LIMIT", "1024"))
+MAX_CANDIDATES = 20
+# Score given to names whose numbers differ ("iPhone 15" vs "iPhone 14"): never auto-matched,
+# but still offered to the LLM
+NUMBER_MISMATCH_SCORE = 0.5
+
+def normalize_name(name):
+    """Lowercase, strip punctuation, singularize simple plurals and sort tokens."""
+    tokens = re.sub(r"[^a-z0-9]+", " ", str(name or "").lower()).split()
+    tokens = [token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token for token in tokens]
+    return " ".join(sorted(tokens))
+
+def numbers(normalized):
+    return sorted(re.findall(r"\d+", normalized))
+
+def trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ProductIndex:
+    """
+    In-memory index of inventory product names for local fuzzy matching.
+
+    Names are resolved by exact normalized match, then the alias table (inventory `aliases`
+    fields plus aliases learned from LLM fallbacks), then trigram candidates ranked by
+    edit-distance ratio. Candidates whose numbers differ from the ordered name (models,
+    sizes) score NUMBER_MISMATCH_SCORE. The index is refreshed incrementally: each refresh
+    reads only `_id`, `name` and `aliases` and re-indexes the documents that changed.
+    Learned aliases are kept for the most recent LEARNED_ALIAS_LIMIT names.
+    """
+
+    def __init__(self, collection, refresh_seconds=PRODUCT_INDEX_REFRESH_SECONDS):
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self.documents = {}
+        self.exact = {}
+        self.aliases = {}
+        self.learned_aliases = OrderedDict()
+        self.grams = {}
+        self.last_refresh = 0.0
+        self._lock = threading.RLock()
+
+    def _add(self, name, aliases):
+        normalized = normalize_name(name)
+        self.exact[normalized] = name
+        for gram in trigrams(normalized):
+            self.grams.setdefault(gram, set()).add(name)
+        for alias in aliases:
+            self.aliases[normalize_name(alias)] = name
+
+    def _remove(self, name, aliases):
+        normalized = normalize_name(name)
+        if self.exact.get(normalized) == name:
+            del self.exact[normalized]
+        for gram in trigrams(normalized):
+            names = self.grams.get(gram)
+            if names:
+                names.discard(name)
+                if not names:
+                    del self.grams[gram]
+        for alias in aliases:
+            if self.aliases.get(normalize_name(alias)) == name:
+                del self.aliases[normalize_name(alias)]
+
+    def refresh(self):
+        """Re-indexes added, renamed and deleted inventory documents; returns the number of changes."""
+        current = {
+            doc["_id"]: (doc["name"], tuple(doc.get("aliases") or ()))
+            for doc in self.collection.find({}, {"_id": 1, "name": 1, "aliases": 1})
+            if doc.get("name")
+        }
+        changes = 0
+        with self._lock:
+            for doc_id in self.documents.keys() - current.keys():
+                self._remove(*self.documents.pop(doc_id))
+                changes += 1
+            for doc_id, entry in current.items():
+                previous = self.documents.get(doc_id)
+                if previous == entry:
+                    continue
+                if previous:
+                    self._remove(*previous)
+                self._add(*entry)
+                self.documents[doc_id] = entry
+                changes += 1
+            self.last_refresh = time.monotonic()
+        return changes
+
+    def maybe_refresh(self):
+        if time.monotonic() - self.last_refresh >= self.refresh_seconds:
+            self.refresh()
+
+    def invalidate(self):
+        """Forces a refresh on the next lookup (call after inventory writes)."""
+        self.last_refresh = 0.0
+
+    def names(self):
+        self.maybe_refresh()
+        with self._lock:
+            return {name for name, _ in self.documents.values()}
+
+    def learn_alias(self, ordered_name, product_name):
+        with self._lock:
+            key = normalize_name(ordered_name)
+            self.learned_aliases[key] = product_name
+            self.learned_aliases.move_to_end(key)
+            while len(self.learned_aliases) > LEARNED_ALIAS_LIMIT:
+                self.learned_aliases.popitem(last=False)
+
+    def candidates(self, name, limit=5):
+        """Top inventory names for an ordered name as (name, score) pairs, best first."""
+        normalized = normalize_name(name)
+        with self._lock:
+            shared = {}
+            for gram in trigrams(normalized):
+                for candidate in self.grams.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            shortlist = sorted(shared, key=shared.get, reverse=True)[:MAX_CANDIDATES]
+
+        ordered_numbers = numbers(normalized)
+        scored = []
+        for candidate in shortlist:
+            candidate_normalized = normalize_name(candidate)
+            score = Levenshtein.ratio(normalized, candidate_normalized)
+            if numbers(candidate_normalized) != ordered_numbers:
+                score = min(score, NUMBER_MISMATCH_SCORE)
+            scored.append((candidate, score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def match(self, name):
+        """Returns (inventory_name, confidence); inventory_name is None when nothing plausible exists."""
+        self.maybe_refresh()
+        normalized = normalize_name(name)
+        with self._lock:
+            product = self.exact.get(normalized) or self.aliases.get(normalized)
+            if product:
+                return product, 1.0
+            learned = self.learned_aliases.get(normalized)
+            if learned and self.exact.get(normalize_name(learned)) == learned:
+                self.learned_aliases.move_to_end(normalized)
+                return learned, 1.0
+
+        candidates = self.candidates(name, limit=1)
+        if not candidates:
+            return None, 0.0
+        return candidates[0]
+
+product_index = ProductIndex(db["inventory"])